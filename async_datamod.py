@@ -0,0 +1,187 @@
+# async_datamod.py
+"""
+asyncio facade over datamod_sql for code that doesn't run on Streamlit's
+script thread (background workers, an HTTP API, ...).
+
+Every call runs the matching datamod_sql function on a small bounded thread
+pool. datamod_sql keeps one connection per thread, so each worker has its own
+connection and independent reads run side by side (sqlite releases the GIL
+while a query executes, and WAL lets readers proceed during a write):
+
+    patient, sessions, rom = await asyncio.gather(
+        get_patient(pid), get_sessions_for_patient(pid), get_rom_measurements(pid)
+    )
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import datamod_sql
+
+MAX_WORKERS = 4
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="datamod")
+        return _executor
+
+
+def shutdown(wait: bool = True) -> None:
+    """Stop the worker pool; the next call starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        # worker connections live in thread-local storage and close when the threads exit
+        executor.shutdown(wait=wait)
+
+
+async def _run(fn: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+# ---------- Patients ----------
+async def add_patient_from_record(rec: Dict[str, Any]) -> int:
+    return await _run(datamod_sql.add_patient_from_record, rec)
+
+async def add_patients_bulk(records: List[Dict[str, Any]]) -> List[int]:
+    return await _run(datamod_sql.add_patients_bulk, records)
+
+async def get_all_patients() -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.get_all_patients)
+
+async def get_patient(patient_id: int) -> Optional[Dict[str, Any]]:
+    return await _run(datamod_sql.get_patient, patient_id)
+
+async def find_patient_by_name(name: str) -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.find_patient_by_name, name)
+
+async def list_patients(**kwargs) -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.list_patients, **kwargs)
+
+async def count_patients(filters: Optional[Dict[str, Any]] = None) -> int:
+    return await _run(datamod_sql.count_patients, filters)
+
+async def update_patient_fields(patient_id: int, updates: Dict[str, Any]) -> bool:
+    return await _run(datamod_sql.update_patient_fields, patient_id, updates)
+
+async def search_notes(query: str, **kwargs) -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.search_notes, query, **kwargs)
+
+# ---------- Sessions ----------
+async def add_session(patient_id: int, transcript: str, parsed: Dict[str, Any],
+                      pain_level: Optional[int] = None) -> int:
+    return await _run(datamod_sql.add_session, patient_id, transcript, parsed, pain_level)
+
+async def add_sessions_bulk(rows: List[Dict[str, Any]]) -> List[int]:
+    return await _run(datamod_sql.add_sessions_bulk, rows)
+
+async def get_sessions_for_patient(patient_id: int) -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.get_sessions_for_patient, patient_id)
+
+# ---------- ROM / strength ----------
+async def get_rom_measurements(patient_id: int, joint: Optional[str] = None) -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.get_rom_measurements, patient_id, joint)
+
+async def get_strength_measurements(patient_id: int, muscle_group: Optional[str] = None) -> List[Dict[str, Any]]:
+    return await _run(datamod_sql.get_strength_measurements, patient_id, muscle_group)
+
+async def add_rom_progress(patient_id, rom_type, start_value, end_value):
+    return await _run(datamod_sql.add_rom_progress, patient_id, rom_type, start_value, end_value)
+
+async def get_rom_progress(patient_id):
+    return await _run(datamod_sql.get_rom_progress, patient_id)
+
+# ---------- Users ----------
+async def add_user(username: str, password: str) -> bool:
+    return await _run(datamod_sql.add_user, username, password)
+
+async def verify_user(username: str, password: str) -> bool:
+    return await _run(datamod_sql.verify_user, username, password)
+
+
+# ---------- Screen loaders ----------
+async def load_patient_overview(patient_id: int) -> Dict[str, Any]:
+    """Patient row, sessions and ROM/strength history for one screen, fetched concurrently."""
+    patient, sessions, rom, strength = await asyncio.gather(
+        get_patient(patient_id),
+        get_sessions_for_patient(patient_id),
+        get_rom_measurements(patient_id),
+        get_strength_measurements(patient_id),
+    )
+    return {"patient": patient, "sessions": sessions, "rom": rom, "strength": strength}
+
+
+# -----------------------------
+# Test locally
+# -----------------------------
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+
+    # Throwaway DB so the check never touches pysio.db
+    datamod_sql.DB_FILE = os.path.join(tempfile.mkdtemp(), "async_check.db")
+    datamod_sql.init_db()
+    pid = datamod_sql.add_patient_from_record({"name": "Async Check"})
+    datamod_sql.add_sessions_bulk([
+        {"patient_id": pid, "transcript": f"knee flexion session {i} " * 20,
+         "parsed": {"strength": [{"muscle_group": "quads", "grade": i % 6}]}, "pain_level": i % 11}
+        for i in range(20000)
+    ])
+
+    # Deliberately heavy read so each call takes measurable time
+    HEAVY_SQL = ("SELECT COUNT(*) FROM sessions a JOIN sessions b ON a.pain_level = b.pain_level "
+                 "WHERE a.id % 7 = 0 AND b.id % 5 = 0")
+
+    def heavy_read():
+        return datamod_sql.get_conn().execute(HEAVY_SQL).fetchone()[0]
+
+    # Overlap check: each read calls meet() from inside its query, and meet()
+    # only returns once MAX_WORKERS reads are inside their queries at the same
+    # time. If reads serialise (a shared connection, a lock), the barrier
+    # times out and the check fails instead of printing a ratio.
+    barrier = threading.Barrier(MAX_WORKERS, timeout=5)
+
+    def meet(value):
+        barrier.wait()
+        return value
+
+    def overlapping_read():
+        conn = datamod_sql.get_analytics_conn()
+        conn.create_function("meet", 1, meet)
+        return conn.execute("SELECT meet(COUNT(*)) FROM sessions WHERE patient_id = ?", (pid,)).fetchone()[0]
+
+    async def check():
+        try:
+            counts = await asyncio.gather(*[_run(overlapping_read) for _ in range(MAX_WORKERS)])
+        except Exception as exc:
+            raise AssertionError(f"{MAX_WORKERS} concurrent reads did not overlap: {exc}") from exc
+        assert counts == [20000] * MAX_WORKERS, counts
+        print(f"OK: {MAX_WORKERS} reads were inside their queries at the same time")
+
+        start = time.perf_counter()
+        for _ in range(MAX_WORKERS):
+            await _run(heavy_read)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_run(heavy_read) for _ in range(MAX_WORKERS)])
+        concurrent = time.perf_counter() - start
+
+        overview = await load_patient_overview(pid)
+        print(f"{MAX_WORKERS} CPU-bound reads awaited one by one: {serial:.3f}s, via asyncio.gather: "
+              f"{concurrent:.3f}s ({serial / concurrent:.1f}x on {os.cpu_count()} CPUs)")
+        print(f"overview: {len(overview['sessions'])} sessions, {len(overview['strength'])} strength readings")
+        shutdown()
+
+    asyncio.run(check())
@@ -0,0 +1,192 @@
+# batch_export.py
+"""
+Caseload PDF export: many patients' reports, built in parallel, streamed
+into one zip.
+
+The parent loads each PatientTimeline (one uncached read per patient) and
+hands it to a process pool; workers lay out the PDF, charts included, and
+return the finished bytes, which the parent appends to the zip straight
+away.
+At most max_in_flight reports exist at once, so memory stays bounded
+however large the caseload. Reports whose patient has not changed since
+they were last built come from the report cache without reaching the pool.
+
+    ids = active_patient_ids()                       # seen in the last 90 days
+    ids = patient_ids_seen("2024-05-01", "2024-06-01")
+    result = export_zip(ids, "reports.zip", progress=lambda done, total, pid: ...)
+
+    python batch_export.py [patients] [sessions]     # scaling benchmark
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Union
+
+from patient_timeline import PatientTimeline
+from storage_backend import StorageBackend, get_backend
+
+ACTIVE_DAYS = 90
+# Most patients the Export PDF page puts in one download: Streamlit holds a
+# download button's whole payload in memory.
+ZIP_MAX_PATIENTS = 250
+
+Progress = Callable[[int, int, Optional[int]], None]
+
+
+# ---------- Selecting patients ----------
+def _day(value: Any) -> Optional[str]:
+    # dates/datetimes -> the "YYYY-MM-DD ..." text sessions.created_at compares against
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, datetime) else value.isoformat()
+
+
+def patient_ids_seen(since: Any = None, until: Any = None,
+                     backend: Optional[StorageBackend] = None) -> List[int]:
+    """Patients with a session in [since, until) - dates, datetimes or SQLite timestamp strings."""
+    return (backend or get_backend()).get_patient_ids_seen(_day(since), _day(until))
+
+
+def active_patient_ids(days: int = ACTIVE_DAYS, backend: Optional[StorageBackend] = None) -> List[int]:
+    """Patients seen in the last `days` days (session timestamps are UTC)."""
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    return patient_ids_seen(since, None, backend)
+
+
+# ---------- Worker ----------
+def report_filename(patient: Dict[str, Any]) -> str:
+    name = re.sub(r"[^A-Za-z0-9]+", "_", str(patient.get("name") or "")).strip("_")
+    return f"patient_{patient['id']}{'_' + name if name else ''}.pdf"
+
+
+def build_report(timeline: PatientTimeline) -> bytes:
+    """Lay out one patient's report and return the PDF bytes (runs in a worker)."""
+    from pdf_export import create_patient_pdf
+    return create_patient_pdf(timeline)
+
+
+# ---------- Export ----------
+def export_zip(patient_ids: Iterable[Any], dest: Union[str, IO[bytes]], workers: Optional[int] = None,
+               progress: Optional[Progress] = None, max_in_flight: Optional[int] = None,
+               backend: Optional[StorageBackend] = None) -> Dict[str, Any]:
+    """
+    Write a zip with one PDF per patient to dest (path or writable binary
+    file). progress(done, total, patient_id) is called after each report,
+    and once with (0, total, None) before the first. A report that fails is
+    recorded and skipped; the rest of the batch carries on.
+
+    Returns {"exported": n, "cached": n_from_cache, "failed": {patient_id: "error"},
+    "seconds": t}.
+    """
+    from pdf_export import report_key
+    from report_cache import get_report_cache
+    cache = get_report_cache()
+    backend = backend or get_backend()
+    ids = [int(pid) for pid in patient_ids]
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    total = len(ids)
+    failed: Dict[int, str] = {}
+    done = cached = 0
+    start = time.perf_counter()
+    if progress:
+        progress(0, total, None)
+
+    with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_STORED) as archive, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        queue = iter(ids)
+        in_flight: Dict[Any, tuple] = {}
+
+        def finish(pid):
+            nonlocal done
+            done += 1
+            if progress:
+                progress(done, total, pid)
+
+        def fill():
+            nonlocal cached
+            while len(in_flight) < max_in_flight:
+                pid = next(queue, None)
+                if pid is None:
+                    return
+                # uncached: the read cache would otherwise keep every timeline
+                # of the caseload, transcripts included, in this process
+                timeline = PatientTimeline.load(pid, backend, cached=False)
+                if timeline is None:
+                    failed[pid] = "no such patient"
+                    finish(pid)
+                    continue
+                key = report_key(timeline)
+                pdf = cache.get(key)
+                if pdf is not None:
+                    archive.writestr(report_filename(timeline.patient), pdf)
+                    cached += 1
+                    finish(pid)
+                    continue
+                in_flight[pool.submit(build_report, timeline)] = (pid, report_filename(timeline.patient), key)
+
+        fill()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                pid, filename, key = in_flight.pop(fut)
+                try:
+                    pdf = fut.result()
+                except Exception as exc:
+                    failed[pid] = f"{type(exc).__name__}: {exc}"
+                else:
+                    # PDFs are already compressed; store them as-is
+                    archive.writestr(filename, pdf)
+                    cache.put(key, pdf)
+                finish(pid)
+            fill()
+
+    return {"exported": total - len(failed), "cached": cached, "failed": failed,
+            "seconds": time.perf_counter() - start}
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+if __name__ == "__main__":
+    import sys
+
+    import datamod_sql
+    from storage_backend import SQLiteBackend
+
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    datamod_sql.DB_FILE = os.path.join(tempfile.mkdtemp(), "batch_export.db")
+    datamod_sql.init_db()
+    ids = datamod_sql.add_patients_bulk([{"name": f"Patient {i}", "surgical_procedure": "TKR"}
+                                         for i in range(patients)])
+    datamod_sql.add_sessions_bulk([
+        {"patient_id": pid, "transcript": f"session {n}: knee flexion improving",
+         "parsed": {"strength": [{"muscle_group": "quads", "grade": 1 + n % 5}]}, "pain_level": 9 - n % 9}
+        for pid in ids for n in range(sessions)
+    ])
+    backend = SQLiteBackend()
+
+    from report_cache import get_report_cache
+
+    cpus = os.cpu_count() or 1
+    baseline = None
+    for workers in sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1))):
+        get_report_cache().clear()
+        out = os.path.join(tempfile.mkdtemp(), "reports.zip")
+        result = export_zip(ids, out, workers=workers, backend=backend)
+        baseline = baseline or result["seconds"]
+        print(f"{result['exported']} reports, workers={workers}: {result['seconds']:.2f}s "
+              f"(x{baseline / result['seconds']:.2f}), zip {os.path.getsize(out) / 1e6:.1f} MB, "
+              f"{len(result['failed'])} failed")
+
+    datamod_sql.add_session(ids[0], "one patient with new data", {}, 3)
+    result = export_zip(ids, os.path.join(tempfile.mkdtemp(), "reports.zip"), backend=backend)
+    print(f"re-export after one patient changed: {result['seconds']:.2f}s, "
+          f"{result['cached']} of {result['exported']} reports from cache")
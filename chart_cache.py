@@ -0,0 +1,170 @@
+# chart_cache.py
+"""
+Content-addressed cache for rendered chart PNGs.
+
+A chart's key is a hash of everything that affects its pixels: chart kind,
+patient, the plotted points themselves (x and y) and the render options. Unchanged data
+therefore always hits, new data always misses, and nothing needs explicit
+invalidation.
+
+Two tiers:
+  - memory: LRU bounded by total bytes (per process)
+  - disk (optional): <dir>/<sha256>.png, shared between processes; enable by
+    passing disk_dir or setting PYSIO_CHART_CACHE_DIR
+Entries can also be given a max_age (seconds), after which they are dropped
+from both tiers. report_cache.py reuses the class for generated PDFs.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+def chart_key(*parts: Any) -> str:
+    """Stable sha256 hex digest of the given key parts."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    suffix = ".png"
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_files: int = 2000, max_age: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_files = disk_max_files
+        self.max_age = max_age
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (data, stored_at)
+        self._size = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.max_age is not None and time.time() - stored_at > self.max_age
+
+    # ---------- memory tier ----------
+    def _remember(self, key: str, data: bytes, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (data, time.time() if stored_at is None else stored_at)
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    # ---------- disk tier ----------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}{self.suffix}")
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read(), stored_at
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if not self.disk_dir:
+            return
+        # write to a private temp file then rename: readers never see a partial PNG
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._disk_path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        try:
+            files = [e for e in os.scandir(self.disk_dir) if e.name.endswith(self.suffix)]
+        except OSError:
+            return
+        files.sort(key=lambda e: e.stat().st_mtime)
+        expired = sum(1 for e in files if self._expired(e.stat().st_mtime))
+        excess = max(expired, len(files) - self.disk_max_files)
+        for entry in files[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    # ---------- public API ----------
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self._size -= len(entry[0])
+        entry = self._disk_get(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, *entry)
+        return entry[0]
+
+    def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        self._disk_put(key, data)
+
+    def get_or_render(self, key: str, render: Callable[[], bytes]) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+_charts: Optional[ChartCache] = None
+_charts_lock = threading.Lock()
+
+
+def get_chart_cache() -> ChartCache:
+    """Process-wide chart cache; disk tier enabled by PYSIO_CHART_CACHE_DIR."""
+    global _charts
+    with _charts_lock:
+        if _charts is None:
+            _charts = ChartCache(disk_dir=os.environ.get("PYSIO_CHART_CACHE_DIR") or None)
+        return _charts
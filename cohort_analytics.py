@@ -0,0 +1,141 @@
+# cohort_analytics.py
+"""
+Cross-patient views for the Cohort Analytics page.
+
+Everything is computed from the per-patient, per-week summary the backend
+keeps (patient_week_summary in SQLite, maintained by triggers as sessions
+and measurements arrive), never from sessions.parsed_json. The summary
+holds sums and counts, so every aggregate below is a vectorized groupby of
+sums divided by counts.
+
+    df = load_cohort()
+    pain = pain_trajectory(df)          # week x procedure, mean pain
+    rom = rom_recovery(df)              # week x procedure, mean ROM (degrees)
+    gains = strength_gain(df)           # per patient: last - first weekly grade
+
+    python cohort_analytics.py 100000   # build a 100k-session DB and time it
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from storage_backend import StorageBackend, get_backend
+
+UNSPECIFIED = "Unspecified"
+
+
+def load_cohort(backend: Optional[StorageBackend] = None) -> pd.DataFrame:
+    """The weekly summary as a DataFrame, procedure names normalised for grouping."""
+    df = pd.DataFrame((backend or get_backend()).get_weekly_summary())
+    procedure = df["surgical_procedure"].astype("string").str.strip()
+    df["surgical_procedure"] = procedure.mask(procedure.isna() | (procedure == ""), UNSPECIFIED).astype("category")
+    return df
+
+
+def filter_cohort(df: pd.DataFrame, procedures=None, weeks: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+    mask = np.ones(len(df), dtype=bool)
+    if procedures:
+        mask &= df["surgical_procedure"].isin(procedures).to_numpy()
+    if weeks is not None:
+        mask &= df["week"].between(*weeks).to_numpy()
+    return df[mask]
+
+
+def _weekly_mean(df: pd.DataFrame, total: str, count: str, by: str) -> pd.DataFrame:
+    # mean of all readings in the bucket = sum of sums / sum of counts
+    grouped = df[df[count] > 0].groupby(["week", by], observed=True)[[total, count]].sum()
+    return (grouped[total] / grouped[count]).unstack(by).sort_index()
+
+
+def pain_trajectory(df: pd.DataFrame, by: str = "surgical_procedure") -> pd.DataFrame:
+    """Mean pain level (0-10) per week since surgery, one column per group."""
+    return _weekly_mean(df, "pain_sum", "pain_n", by)
+
+
+def rom_recovery(df: pd.DataFrame, by: str = "surgical_procedure") -> pd.DataFrame:
+    """Mean ROM reading (end angle, else active) per week since surgery, one column per group."""
+    return _weekly_mean(df, "rom_sum", "rom_n", by)
+
+
+def strength_gain(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per patient with strength readings in at least two different weeks: the
+    mean grade of their last such week minus that of their first.
+    """
+    s = df[df["strength_n"] > 0].sort_values(["patient_id", "week"])
+    means = s["strength_sum"] / s["strength_n"]
+    g = means.groupby(s["patient_id"])
+    weeks = g.size()
+    gains = pd.DataFrame({
+        "gain": g.last() - g.first(),
+        "surgical_procedure": s.groupby("patient_id")["surgical_procedure"].first(),
+    })
+    return gains[weeks > 1]
+
+
+def strength_gain_distribution(gains: pd.DataFrame, bin_size: float = 0.5) -> pd.DataFrame:
+    """Patients per strength-gain bin (rows) and procedure (columns)."""
+    bins = (np.floor(gains["gain"] / bin_size) * bin_size).rename("gain")
+    return pd.crosstab(bins, gains["surgical_procedure"]).sort_index()
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    import time
+    from datetime import datetime, timedelta
+
+    import datamod_sql
+    from storage_backend import SQLiteBackend
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    per_patient = 40
+    procedures = ["TKR", "THR", "ACL repair", "Rotator cuff repair", None]
+
+    datamod_sql.DB_FILE = os.path.join(tempfile.mkdtemp(), "cohort_bench.db")
+    datamod_sql.init_db()
+    rng = np.random.default_rng(7)
+    surgery = datetime(2024, 1, 1)
+
+    start = time.perf_counter()
+    patients = datamod_sql.add_patients_bulk([
+        {"name": f"patient {i}", "surgical_procedure": procedures[i % len(procedures)],
+         "surgery_date": (surgery + timedelta(days=int(i % 90))).strftime("%Y-%m-%d")}
+        for i in range(max(1, total // per_patient))
+    ])
+    rows = []
+    for n in range(total):
+        pid = patients[n % len(patients)]
+        visit = n // len(patients)
+        when = surgery + timedelta(days=int(visit * 4 + rng.integers(0, 90)))
+        rows.append({
+            "patient_id": pid,
+            "transcript": f"visit {visit}",
+            "parsed": {"rom": [{"rom_type": "knee_flexion", "start": 20, "end": float(40 + visit * 2)}],
+                       "strength": [{"muscle_group": "quads", "grade": min(5, 1 + visit // 8)}]},
+            "pain_level": int(max(0, 8 - visit // 5)),
+            "created_at": when.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    for i in range(0, len(rows), 10_000):
+        datamod_sql.add_sessions_bulk(rows[i:i + 10_000])
+    print(f"built {total} sessions for {len(patients)} patients "
+          f"(summary kept by triggers): {time.perf_counter() - start:.1f}s")
+
+    backend = SQLiteBackend()
+    start = time.perf_counter()
+    datamod_sql.read_cache.clear()  # time the real read, not a cache hit
+    df = load_cohort(backend)
+    loaded = time.perf_counter() - start
+    start = time.perf_counter()
+    pain = pain_trajectory(df)
+    rom = rom_recovery(df)
+    dist = strength_gain_distribution(strength_gain(df))
+    aggregated = time.perf_counter() - start
+    print(f"summary rows: {len(df)}; load {loaded * 1000:.0f} ms, aggregate {aggregated * 1000:.0f} ms, "
+          f"total {(loaded + aggregated) * 1000:.0f} ms")
+    print(pain.head().round(2))
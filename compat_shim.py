@@ -2,33 +2,104 @@
 """
 Compatibility shim to expose the names main.py expects while using your existing datamod_sql,
 pdf_export, voice_module, voice_parser implementations.
+
+Heavy dependencies (pandas, the PDF/matplotlib stack, speech_recognition and
+pydub) are imported inside the functions that use them, so importing this
+module - and with it the app's Home page - does not pay for them.
 """
 
 import json
-import pandas as pd
-from typing import Optional
-
-# datamod_sql functions
-from datamod_sql import (
-    add_patient_from_record,
-    get_all_patients,
-    get_patient,
-    get_sessions_for_patient,
-    add_session,
-    update_patient_fields,
-    init_db
+from typing import TYPE_CHECKING, Optional
+
+# storage (datamod_sql by default, see storage_backend.py)
+from storage_backend import get_backend
+from query_cache import QueryCache
+from chart_cache import get_chart_cache
+from patient_directory import get_directory
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from patient_timeline import PatientTimeline
+
+# DataFrames built below are cached until the backend reports a write to their tables
+frame_cache = QueryCache(
+    version_source=lambda tables: get_backend().data_version(tables),
+    scope=lambda: id(get_backend()),
+    maxsize=64,
 )
 
-# voice / parser
-from voice_module import transcribe_microphone, transcribe_uploaded_file
-from voice_parser import extract_rom_data
-from ui_voice import normalize_parsed
 
-# pdf export
-from pdf_export import create_patient_pdf
+# ---------- Storage passthroughs ----------
+def get_all_patients() -> list:
+    return get_backend().get_all_patients()
+
+
+def get_patient(patient_id: int) -> Optional[dict]:
+    return get_backend().get_patient(patient_id)
+
+
+def add_patient_from_record(record: dict) -> int:
+    pid = get_backend().add_patient(record)
+    get_directory().upsert(pid)
+    return pid
+
+
+def update_patient_fields(patient_id: int, updates: dict) -> bool:
+    changed = get_backend().update_patient_fields(patient_id, updates)
+    get_directory().upsert(patient_id)
+    return changed
+
+
+def add_session(patient_id: int, transcript: str, parsed: dict, pain_level: Optional[int] = None) -> int:
+    return get_backend().add_session(patient_id, transcript, parsed, pain_level)
+
+
+def get_sessions_for_patient(patient_id: int) -> list:
+    return get_backend().get_sessions_for_patient(patient_id)
+
+
+def list_patients(**kwargs) -> list:
+    return get_backend().list_patients(**kwargs)
+
+
+def count_patients(filters: Optional[dict] = None) -> int:
+    return get_backend().count_patients(filters)
+
+
+def search_notes(query: str, patient_id: Optional[int] = None, limit: int = 50, since: Optional[str] = None) -> list:
+    return get_backend().search_notes(query, patient_id=patient_id, limit=limit, since=since)
+
+
+def use_session_connections(state) -> None:
+    """Reuse one set of storage connections across a browser session's reruns; main.py calls this first."""
+    get_backend().bind_connections(state)
+
+
+def storage_description() -> str:
+    backend = get_backend()
+    return f"{backend.name} ({getattr(backend, 'location', 'n/a')})"
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for the DataFrame cache and, on SQLite, the query cache."""
+    stats = {"frames": frame_cache.stats()}
+    try:
+        from datamod_sql import read_cache
+        stats["queries"] = read_cache.stats()
+    except ImportError:
+        pass
+    return stats
+
+
+def chart_cache_stats() -> dict:
+    """Memory/disk hit counters and size of the rendered-chart cache."""
+    return get_chart_cache().stats()
 
-# Initialize DB
-init_db()
+
+def report_cache_stats() -> dict:
+    """Memory/disk hit counters and size of the generated-report cache."""
+    from report_cache import get_report_cache
+    return get_report_cache().stats()
 
 
 # ---------- DB API expected by main.py ----------
@@ -39,7 +110,9 @@ def save_record_sql(record_dict: dict) -> int:
     return add_patient_from_record(record_dict)
 
 
-def load_all_patients_sql() -> pd.DataFrame:
+@frame_cache.cached("patients")
+def load_all_patients_sql() -> "pd.DataFrame":
+    import pandas as pd
     rows = get_all_patients()
     if not rows:
         return pd.DataFrame()
@@ -54,6 +127,75 @@ def load_all_patients_sql() -> pd.DataFrame:
     return df
 
 
+@frame_cache.cached("patients")
+def load_patients_page(after_id=None, after_value=None, limit: int = 50, filters: Optional[dict] = None,
+                       order_by: str = "id", descending: bool = True) -> "pd.DataFrame":
+    """
+    One page of the patient list as a DataFrame (id exposed as patient_id).
+    Paging, sorting and filtering all happen in SQL.
+    """
+    import pandas as pd
+    rows = list_patients(after_id=after_id, after_value=after_value, limit=limit,
+                         filters=filters, order_by=order_by, descending=descending)
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df = df.rename(columns={"id": "patient_id"})
+    df["patient_id"] = df["patient_id"].astype(str)
+    return df
+
+
+def next_page_cursor(page_df: "pd.DataFrame", order_by: str = "id") -> tuple:
+    """
+    (after_value, after_id) for the page following page_df, as plain Python
+    values that sqlite can bind (pandas hands back NaN / numpy scalars).
+    """
+    import pandas as pd
+    last = page_df.iloc[-1]
+    value = None
+    if order_by != "id":
+        value = last[order_by]
+        if pd.isna(value):
+            value = None
+        elif hasattr(value, "item"):
+            value = value.item()
+    return value, int(last["patient_id"])
+
+
+SESSION_HISTORY_LABELS = {
+    "date": "Date/Time",
+    "pain_level": "Pain (0-10)",
+    "rom_summary": "ROM",
+    "strength_summary": "Strength",
+    "notes": "Notes",
+}
+
+
+@frame_cache.cached("sessions", "rom_measurements", "strength_measurements")
+def load_session_history(patient_id) -> "pd.DataFrame":
+    """Display-ready session history for the View Patients page, newest first."""
+    import pandas as pd
+    rows = get_backend().get_session_history(int(patient_id))
+    df = pd.DataFrame(rows, columns=["id", *SESSION_HISTORY_LABELS])
+    df["pain_level"] = pd.to_numeric(df["pain_level"], errors="coerce").astype("Int64")
+    df[["rom_summary", "strength_summary"]] = df[["rom_summary", "strength_summary"]].fillna("N/A")
+    return df.drop(columns=["id"]).rename(columns=SESSION_HISTORY_LABELS)
+
+
+@frame_cache.cached("patients", "sessions", "rom_measurements", "strength_measurements")
+def load_timeline(patient_id) -> Optional["PatientTimeline"]:
+    """One patient's charts-and-report data, shared by every plot and the PDF."""
+    from patient_timeline import PatientTimeline
+    return PatientTimeline.load(patient_id)
+
+
+@frame_cache.cached("patients", "sessions", "rom_measurements", "strength_measurements")
+def load_cohort_frame() -> "pd.DataFrame":
+    """Per-patient, per-week summary for the Cohort Analytics page."""
+    from cohort_analytics import load_cohort
+    return load_cohort(get_backend())
+
+
 def load_single_patient_sql(patient_id) -> dict:
     try:
         pid = int(patient_id)
@@ -63,12 +205,28 @@ def load_single_patient_sql(patient_id) -> dict:
 
 
 # ---------- PDF wrapper ----------
+def build_patient_pdf(patient_id: int, full_history: bool = False) -> bytes:
+    """
+    The patient's PDF report, built entirely in memory - or served from the
+    report cache when nothing about the patient has changed since.
+    full_history=True lists every session with complete notes.
+    """
+    from pdf_export import create_patient_pdf, report_key
+    from report_cache import get_report_cache
+    pid = int(patient_id)
+    timeline = load_timeline(pid)
+    if timeline is None:
+        raise LookupError(f"No patient with id {pid}")
+    return get_report_cache().get_or_render(report_key(timeline, full_history=full_history),
+                                            lambda: create_patient_pdf(timeline, full_history=full_history))
+
+
 def generate_patient_pdf(patient_id: int) -> str:
+    """Write the report to patient_{id}_summary.pdf (for scripts; the app downloads build_patient_pdf)."""
     pid = int(patient_id)
-    patient = get_patient(pid)
-    sessions = get_sessions_for_patient(pid)
     out_path = f"patient_{pid}_summary.pdf"
-    create_patient_pdf(patient, sessions, out_path)
+    with open(out_path, "wb") as f:
+        f.write(build_patient_pdf(pid))
     return out_path
 
 
@@ -78,6 +236,7 @@ def convert_voice_to_text(uploaded_file_or_none: Optional[object] = None) -> str
     If uploaded_file_or_none is None -> use microphone.
     If it's a file-like object from Streamlit -> use transcribe_uploaded_file.
     """
+    from voice_module import transcribe_microphone, transcribe_uploaded_file
     try:
         if uploaded_file_or_none is None:
             return transcribe_microphone()
@@ -91,6 +250,8 @@ def extract_structured_keywords(text: str) -> dict:
     Converts voice_parser output into normalized dict expected by ui_voice.py.
     Guarantees actionable data is recognized.
     """
+    from voice_parser import extract_rom_data
+    from ui_voice import normalize_parsed
     parsed_list = extract_rom_data(text)
     normalized = normalize_parsed(parsed_list)
 
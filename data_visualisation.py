@@ -1,149 +1,149 @@
-import matplotlib.pyplot as plt
-import sqlite3
+import io
+
+import matplotlib
+matplotlib.use("Agg")  # headless PNG rendering; never probe for a GUI toolkit
+# Figures are built as explicit Figure objects on the Agg canvas: no pyplot
+# state machine, so concurrent Streamlit sessions and pool workers can render
+# at the same time without sharing a "current figure".
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import pandas as pd
-import json
 from datetime import datetime
 
-# Define the database path
-DB_PATH = "pysio.db"
+from chart_cache import chart_key, get_chart_cache
+from patient_timeline import PatientTimeline
 
-# -----------------------------
-# DATABASE CONNECTION FUNCTION
-# -----------------------------
-def get_connection():
-    """Establishes a connection to the SQLite database."""
-    return sqlite3.connect(DB_PATH)
+# Bump when the look of a chart changes so cached PNGs (memory and disk) are
+# not served for the old style.
+CHART_STYLE_VERSION = 2
 
 # -----------------------------
 # LOAD PATIENT RECORDS INTO DF
 # -----------------------------
+def as_timeline(patient):
+    """Accept a PatientTimeline or a patient id; ids are loaded once here."""
+    if isinstance(patient, PatientTimeline):
+        return patient
+    return PatientTimeline.load(patient)
+
 def load_patient_records(patient_id):
     """
-    Loads all session records for a patient, parses the necessary data,
-    and returns a DataFrame suitable for visualization.
-    """
-    conn = get_connection()
-    # Use Row factory to access columns by name like a dictionary
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    # NOTE: Assuming 'parsed_json' and 'pain_level' columns exist in the 'sessions' table.
-    query = """
-        SELECT created_at, parsed_json, pain_level
-        FROM sessions
-        WHERE patient_id = ?
-        ORDER BY created_at ASC;
+    Session series for a patient (id, created_at, pain_level, strength,
+    session_number), oldest first, as a DataFrame suitable for visualization.
     """
+    timeline = as_timeline(patient_id)
+    return timeline.sessions if timeline is not None else pd.DataFrame()
 
-    # Ensure patient_id is an integer for the query
-    cur.execute(query, (int(patient_id),))
-    rows = cur.fetchall()
-    conn.close()
-
-    # Convert list of sqlite.Row objects to a list of dictionaries for robust DataFrame creation
-    data = [dict(row) for row in rows]
-    df = pd.DataFrame(data)
-
-    if df.empty:
-        return df
-
-    # Parse JSON field. This handles the KeyError by ensuring the column is accessed correctly.
-    df["parsed_json"] = df["parsed_json"].apply(
-        lambda x: json.loads(x) if isinstance(x, str) else {}
-    )
-
-    # --- Data Extraction Helpers ---
-
-    def extract_strength(p):
-        """
-        Extracts the grade of the first strength entry.
-        FIXED: Accessing ['grade'] key instead of array index [1].
-        """
-        if p.get("strength") and p["strength"][0].get("grade") is not None:
-            # Strength is an array of dicts: [{"muscle_group": "quads", "grade": 4}]
-            return p["strength"][0]["grade"]
-        return None
-
-    # Apply extraction
-    df["strength"] = df["parsed_json"].apply(extract_strength)
+def _new_figure(figsize):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
 
-    # Clean up pain level (ensure it's numeric)
-    df["pain_level"] = pd.to_numeric(df["pain_level"], errors='coerce')
-
-    # Create a simple session number index for the X-axis
-    df["session_number"] = range(1, len(df) + 1)
-    
-    return df.dropna(subset=['session_number']) # Ensure we only plot valid sessions
+def _png_bytes(fig, dpi):
+    """Render a figure to PNG bytes."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi)
+    return buf.getvalue()
 
 # ------------------------------------------------------------
 # 1. Pain Trend Plot (0-10)
 # ------------------------------------------------------------
-def plot_pain_trend(patient_id):
-    """Generates a line plot of pain level over successive sessions."""
-    df = load_patient_records(patient_id)
-    
-    # Filter for records that actually contain pain data
-    df_plot = df.dropna(subset=["pain_level"])
+def _render_pain_trend(patient_id, x, y, figsize, dpi):
+    fig, ax = _new_figure(figsize)
+    ax.plot(x, y, marker='o', linestyle='-', color='#C0392B', linewidth=2)
 
-    if df_plot.empty:
-        return None
+    ax.set_xlabel("Session Number", fontsize=12)
+    ax.set_ylabel("Pain Level (0-10)", fontsize=12)
+    ax.set_title(f"Patient {patient_id} Pain Trend by Session", fontsize=14, fontweight='bold')
 
-    plt.figure(figsize=(8, 4))
-    plt.plot(df_plot["session_number"], df_plot["pain_level"], 
-             marker='o', linestyle='-', color='#C0392B', linewidth=2)
-    
-    plt.xlabel("Session Number", fontsize=12)
-    plt.ylabel("Pain Level (0-10)", fontsize=12)
-    plt.title(f"Patient {patient_id} Pain Trend by Session", fontsize=14, fontweight='bold')
-    
     # Set Y-axis limits for consistency (0 to 10)
-    plt.yticks(range(0, 11, 2))
-    plt.ylim(0, 10.5) 
+    ax.set_yticks(range(0, 11, 2))
+    ax.set_ylim(0, 10.5)
 
     # Set X-axis ticks to match session numbers
-    plt.xticks(df_plot["session_number"])
-    
-    plt.grid(True, which='major', linestyle='--', alpha=0.6)
-    plt.tight_layout()
+    ax.set_xticks(x)
+
+    ax.grid(True, which='major', linestyle='--', alpha=0.6)
+    fig.tight_layout()
 
-    path = f"pain_trend_{patient_id}.png"
-    plt.savefig(path)
-    plt.close()
-    return path
+    return _png_bytes(fig, dpi)
 
 # ------------------------------------------------------------
 # 2. Strength Progress Plot (Manual Muscle Test Grade)
 # ------------------------------------------------------------
-def plot_strength_progress(patient_id):
-    """Generates a line plot of strength grade over successive sessions."""
-    df = load_patient_records(patient_id)
-    
-    # Filter for records that actually contain strength data
-    df_plot = df.dropna(subset=["strength"])
+def _render_strength_progress(patient_id, x, y, figsize, dpi):
+    fig, ax = _new_figure(figsize)
+    ax.plot(x, y, marker='s', linestyle='-', color='#2980B9', linewidth=2)
 
-    if df_plot.empty:
-        return None
+    ax.set_xlabel("Session Number", fontsize=12)
+    ax.set_ylabel("Strength Grade (0-5)", fontsize=12)
+    ax.set_title(f"Patient {patient_id} Strength Progress by Session", fontsize=14, fontweight='bold')
 
-    plt.figure(figsize=(8, 4))
-    plt.plot(df_plot["session_number"], df_plot["strength"], 
-             marker='s', linestyle='-', color='#2980B9', linewidth=2)
-    
-    plt.xlabel("Session Number", fontsize=12)
-    plt.ylabel("Strength Grade (0-5)", fontsize=12)
-    plt.title(f"Patient {patient_id} Strength Progress by Session", fontsize=14, fontweight='bold')
-    
     # Set Y-axis limits and labels for consistency (0 to 5 MMT grades)
-    plt.yticks(range(0, 6)) 
-    plt.ylim(0, 5.5) 
-    
+    ax.set_yticks(range(0, 6))
+    ax.set_ylim(0, 5.5)
+
     # Set X-axis ticks to match session numbers
-    plt.xticks(df_plot["session_number"])
-    
-    plt.grid(True, which='major', linestyle='--', alpha=0.6)
-    plt.tight_layout()
+    ax.set_xticks(x)
+
+    ax.grid(True, which='major', linestyle='--', alpha=0.6)
+    fig.tight_layout()
 
-    path = f"strength_progress_{patient_id}.png"
-    plt.savefig(path)
-    plt.close()
-    return path
+    return _png_bytes(fig, dpi)
 
+# ------------------------------------------------------------
+# Chart registry, jobs and cached entry points
+# ------------------------------------------------------------
+# kind -> (timeline series property, value column, renderer)
+CHARTS = {
+    "pain_trend": ("pain", "pain_level", _render_pain_trend),
+    "strength_progress": ("strength", "strength", _render_strength_progress),
+}
+
+def chart_job(timeline, kind, figsize=(8, 4), dpi=100):
+    """
+    (cache key, render_chart args) for one chart of a timeline, or None when
+    there is nothing to plot. The args are plain lists and tuples, so a job
+    can be rendered in another process (see render_service.py).
+    """
+    series, column, _ = CHARTS[kind]
+    df_plot = getattr(timeline, series)
+    if df_plot.empty:
+        return None
+    x = df_plot["session_number"].tolist()
+    values = df_plot[column].tolist()
+    # every render_chart input is in the key: session numbers shift when an
+    # older session without this metric is inserted, even if ids/values don't
+    key = chart_key(CHART_STYLE_VERSION, kind, timeline.patient_id, df_plot["id"].tolist(), x, values,
+                    sorted({"figsize": tuple(figsize), "dpi": dpi}.items()))
+    return key, (kind, timeline.patient_id, x, values, tuple(figsize), dpi)
+
+def render_chart(kind, patient_id, x, y, figsize, dpi):
+    """Render one chart to PNG bytes. Pure function of its arguments; safe in any thread or process."""
+    return CHARTS[kind][2](patient_id, x, y, figsize, dpi)
+
+def _cached_chart(kind, patient, figsize, dpi):
+    timeline = as_timeline(patient)
+    if timeline is None:
+        return None
+    job = chart_job(timeline, kind, figsize, dpi)
+    if job is None:
+        return None
+    key, args = job
+    return get_chart_cache().get_or_render(key, lambda: render_chart(*args))
+
+def plot_pain_trend(patient, figsize=(8, 4), dpi=100):
+    """
+    Line plot of pain level over successive sessions, as PNG bytes (None if no
+    data). `patient` is a PatientTimeline (preferred, shared with the other
+    charts and the PDF) or a patient id.
+    """
+    return _cached_chart("pain_trend", patient, figsize, dpi)
+
+def plot_strength_progress(patient, figsize=(8, 4), dpi=100):
+    """
+    Line plot of strength grade over successive sessions, as PNG bytes (None if no
+    data). `patient` is a PatientTimeline (preferred, shared with the other
+    charts and the PDF) or a patient id.
+    """
+    return _cached_chart("strength_progress", patient, figsize, dpi)
@@ -1,18 +1,249 @@
 # data_module.py
 import sqlite3
 import json
-from typing import Dict, Any, List, Optional
+import os
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
 from datetime import datetime
+from pathlib import Path
 import hashlib
 
+from query_cache import QueryCache
+from record_schema import (
+    PATIENT_LIST_COLUMNS,
+    PATIENT_NOTE_COLUMNS,
+    PATIENT_SORT_KEYS,
+    WEEKLY_SUMMARY_COLUMNS,
+    loads,
+    rom_rows,
+    session_measurements,
+    strength_rows,
+)
+
 DB_FILE = "pysio.db"
 
-def get_conn():
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
+# ---------- Connection management ----------
+# Connections are opened once per ConnectionSet and reused. By default each
+# thread has its own set. Under Streamlit every rerun executes on a fresh
+# ScriptRunner thread, so main.py keeps one set per browser session (in
+# st.session_state) and binds it to each run's thread with use_connections():
+# the connections and their PRAGMAs survive reruns and are closed when the
+# session's state is dropped. A session's runs never overlap, so handing the
+# set from one run's thread to the next is safe (check_same_thread=False).
+# WAL lets readers carry on while a writer commits.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+
+
+def _close_all(*groups: Dict[str, sqlite3.Connection]) -> None:
+    for conns in groups:
+        for conn in conns.values():
+            conn.close()
+        conns.clear()
+
+
+class ConnectionSet:
+    """One owner's connections (DB_FILE -> connection): read-write and analytics."""
+
+    def __init__(self):
+        self.conns: Dict[str, sqlite3.Connection] = {}
+        self.analytics: Dict[str, sqlite3.Connection] = {}
+        # closes them when the owner drops the set (e.g. a session ends)
+        self._finalizer = weakref.finalize(self, _close_all, self.conns, self.analytics)
+
+    def close(self) -> None:
+        _close_all(self.conns, self.analytics)
+
+
+def use_connections(connections: Optional[ConnectionSet]) -> None:
+    """Make the calling thread use `connections` (None: its own per-thread set again)."""
+    _local.bound = connections
+
+
+def _connections() -> ConnectionSet:
+    bound = getattr(_local, "bound", None)
+    if bound is not None:
+        return bound
+    own = getattr(_local, "own", None)
+    if own is None:
+        own = _local.own = ConnectionSet()
+    return own
+
+
+def _open_conn(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_conn() -> sqlite3.Connection:
+    """
+    Return this thread's connection to DB_FILE (from its bound ConnectionSet,
+    if any), opening and configuring it on first use. Callers must not close
+    it; use close_conn() when a thread is done with the DB.
+
+    The first connection to a file creates or migrates it (init_db), so
+    importing this module touches no file: set DB_FILE before the first call.
+    """
+    conns = _connections().conns
+    conn = conns.get(DB_FILE)
+    if conn is None:
+        conn = conns[DB_FILE] = _open_conn(DB_FILE)
+        try:
+            init_db()  # a dict lookup once this process knows the file is current
+        except BaseException:
+            del conns[DB_FILE]
+            conn.close()
+            raise
+    return conn
+
+
+def close_conn() -> None:
+    """Close every connection (read-write and analytics) the current thread uses."""
+    _connections().close()
+
+
+# ---------- Read-only analytics connections ----------
+# Cached reads (patients, charts, trends, reports) use a separate per-thread
+# connection opened with mode=ro and query_only, so a long scan can never
+# take a write lock or hold up live session entry. It gets a bigger cache and mmap window than the
+# OLTP connection because it reads whole patient histories and cohorts.
+ANALYTICS_PRAGMAS = (
+    "PRAGMA query_only=1",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-65536",      # ~64 MB page cache
+    "PRAGMA mmap_size=1073741824",   # 1 GB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+
 
-def init_db():
+def _open_analytics_conn(path: str) -> sqlite3.Connection:
+    uri = Path(os.path.abspath(path)).as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=5.0)
+    for pragma in ANALYTICS_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_analytics_conn() -> sqlite3.Connection:
+    """Return this thread's read-only connection to DB_FILE."""
+    conns = _connections().analytics
+    conn = conns.get(DB_FILE)
+    if conn is None:
+        init_db()  # mode=ro cannot create the file
+        conn = conns[DB_FILE] = _open_analytics_conn(DB_FILE)
+    return conn
+
+
+@contextmanager
+def read_snapshot() -> Iterator[sqlite3.Connection]:
+    """
+    Hold one read transaction on this thread's analytics connection, so every
+    query in the block sees the same committed state. Nested blocks join the
+    outer one. The cached reads below each run inside one together with
+    their data_versions lookup (see read_cache).
+    """
+    conn = get_analytics_conn()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Run a block of statements as one write transaction:
+
+        with transaction() as conn:
+            conn.execute(...)
+
+    Commits on success and rolls back on error. The write lock is taken up front
+    (BEGIN IMMEDIATE) so the block never fails half-way with "database is locked".
+    Nested blocks join the outer transaction.
+    """
     conn = get_conn()
-    cur = conn.cursor()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+# ---------- Schema migrations ----------
+# The schema version lives in PRAGMA user_version. Each step below moves the
+# database up by one version; append new steps, never edit or reorder old ones.
+_current_versions: Dict[str, int] = {}   # abs path -> version, once known current
+
+
+def init_db() -> int:
+    """
+    Bring the database up to SCHEMA_VERSION. Returns the resulting version.
+
+    The common case is a database that is already current: that costs one
+    PRAGMA user_version read (no transaction, no lock), and nothing at all on
+    later calls in the same process. DDL only runs on first creation or an
+    upgrade, inside migrate()'s write transaction, which re-reads the version
+    first - processes starting together queue on the lock and all but the
+    first find nothing left to do.
+    """
+    path = os.path.abspath(DB_FILE)
+    version = _current_versions.get(path)
+    if version is not None:
+        return version
+    version = get_conn().execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        version = _migrate_when_unlocked()
+    _current_versions[path] = version
+    return version
+
+
+def _migrate_when_unlocked(attempts: int = 8) -> int:
+    # a long migration in another process can outlast busy_timeout; keep waiting
+    for attempt in range(attempts):
+        try:
+            return migrate()
+        except sqlite3.OperationalError as exc:
+            if "locked" not in str(exc).lower() or attempt == attempts - 1:
+                raise
+            time.sleep(0.05 * (2 ** attempt))
+
+
+def migrate() -> int:
+    with transaction() as conn:
+        cur = conn.cursor()
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            step(cur)
+            # PRAGMA does not take parameters; number is always a trusted int
+            cur.execute(f"PRAGMA user_version = {int(number)}")
+        return max(version, SCHEMA_VERSION)
+
+
+def _create_tables(cur: sqlite3.Cursor):
     # patients table
     cur.execute("""
     CREATE TABLE IF NOT EXISTS patients (
@@ -91,70 +322,635 @@ def init_db():
         FOREIGN KEY(patient_id) REFERENCES patients(id)
     )
     """)
-    conn.commit()
-    conn.close()
 
-# ---------- Patient CRUD ----------
-def add_patient_from_record(rec: Dict[str, Any]) -> int:
+def _add_history_indexes(cur: sqlite3.Cursor):
+    # per-patient history is always read as "WHERE patient_id = ? ORDER BY created_at"
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_patient_created ON sessions(patient_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rom_progress_patient_created ON rom_progress(patient_id, created_at)")
+
+
+def _add_patient_name_index(cur: sqlite3.Cursor):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_patients_name_nocase ON patients(name COLLATE NOCASE)")
+
+
+def _add_notes_fts(cur: sqlite3.Cursor):
+    # External-content FTS5 tables: the text stays in sessions/patients, the
+    # triggers below keep the full-text index in step with every write.
+    cols = ", ".join(PATIENT_NOTE_COLUMNS)
+    old_cols = ", ".join(f"old.{c}" for c in PATIENT_NOTE_COLUMNS)
+    new_cols = ", ".join(f"new.{c}" for c in PATIENT_NOTE_COLUMNS)
+
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts
+    USING fts5(transcript, content='sessions', content_rowid='id')
+    """)
+    # one execute per trigger: executescript() would commit the migration transaction
+    for trigger in (
+        """CREATE TRIGGER IF NOT EXISTS sessions_fts_ai AFTER INSERT ON sessions BEGIN
+            INSERT INTO sessions_fts(rowid, transcript) VALUES (new.id, new.transcript);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS sessions_fts_ad AFTER DELETE ON sessions BEGIN
+            INSERT INTO sessions_fts(sessions_fts, rowid, transcript) VALUES ('delete', old.id, old.transcript);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS sessions_fts_au AFTER UPDATE OF transcript ON sessions BEGIN
+            INSERT INTO sessions_fts(sessions_fts, rowid, transcript) VALUES ('delete', old.id, old.transcript);
+            INSERT INTO sessions_fts(rowid, transcript) VALUES (new.id, new.transcript);
+        END""",
+    ):
+        cur.execute(trigger)
+
+    cur.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts
+    USING fts5({cols}, content='patients', content_rowid='id')
+    """)
+    for trigger in (
+        f"""CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts(patients_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF {cols} ON patients BEGIN
+            INSERT INTO patients_fts(patients_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO patients_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+        END""",
+    ):
+        cur.execute(trigger)
+
+    # index whatever was written before this migration
+    cur.execute("INSERT INTO sessions_fts(sessions_fts) VALUES ('rebuild')")
+    cur.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+
+
+def _add_measurement_tables(cur: sqlite3.Cursor):
+    # ROM and strength readings as rows instead of JSON lists. session_id is
+    # NULL for readings captured on the intake form.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rom_measurements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        session_id INTEGER,
+        joint TEXT,
+        active REAL,
+        passive REAL,
+        start_value REAL,
+        end_value REAL,
+        measured_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(patient_id) REFERENCES patients(id),
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS strength_measurements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id INTEGER,
+        session_id INTEGER,
+        muscle_group TEXT,
+        grade REAL,
+        measured_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(patient_id) REFERENCES patients(id),
+        FOREIGN KEY(session_id) REFERENCES sessions(id)
+    )
+    """)
+    for table in ("rom_measurements", "strength_measurements"):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_patient_measured ON {table}(patient_id, measured_at)")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_session ON {table}(session_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rom_measurements_joint ON rom_measurements(joint, measured_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_strength_measurements_group ON strength_measurements(muscle_group, measured_at)")
+    _backfill_measurements(cur)
+
+
+def _voice_copies(parsed: Any) -> tuple:
+    # (rom, strength) entries exactly as the pre-measurement voice flow
+    # appended a session's readings to the patient's JSON blobs
+    if not isinstance(parsed, dict):
+        return [], []
+    rom = []
+    for r in parsed.get("rom") or []:
+        if not isinstance(r, dict):
+            continue
+        joint = r.get("rom_type") or r.get("joint")
+        if joint:
+            rom.append({"joint": joint, "start": r.get("start"), "end": r.get("end")})
+    strength = []
+    for e in parsed.get("strength") or []:
+        if not isinstance(e, dict):
+            continue
+        group = e.get("muscle_group") or e.get("muscle")
+        if group is not None and e.get("grade") is not None:
+            strength.append({"muscle_group": group, "grade": e.get("grade")})
+    return rom, strength
+
+
+def _strip_copies(entries: Any, copies: List[list]) -> list:
+    # copies: per session, oldest first. Each copy was appended to the end of
+    # the blob in the same click that saved its session, so walk back from
+    # the newest session and drop its entries only where the blob ends with
+    # exactly them; anything else is a reading of its own.
+    entries = entries if isinstance(entries, list) else []
+    end = len(entries)
+    for chunk in reversed(copies):
+        if chunk and len(chunk) <= end and entries[end - len(chunk):end] == chunk:
+            end -= len(chunk)
+    return entries[:end]
+
+
+def _backfill_measurements(cur: sqlite3.Cursor):
     """
-    Dynamically insert a patient record based on current DB columns.
+    One-time copy of the JSON blobs into the measurement tables.
+
+    The voice flow also appended each session's readings to the patient's
+    blobs. Those copies are recognised by provenance - their exact shape, in
+    session order at the end of the blob - and skipped; a patient-level
+    reading that merely has the same values as a session's is kept.
     """
-    conn = get_conn()
-    cur = conn.cursor()
+    rom_copies: Dict[Any, List[list]] = {}
+    strength_copies: Dict[Any, List[list]] = {}
+    sessions = cur.execute(
+        "SELECT id, patient_id, parsed_json, created_at FROM sessions ORDER BY created_at, id"
+    ).fetchall()
+    for sid, pid, parsed_json, created_at in sessions:
+        parsed = loads(parsed_json, {})
+        rom, strength = session_measurements(parsed)
+        _insert_measurements(cur, pid, rom, strength, session_id=sid, measured_at=created_at)
+        rom_copy, strength_copy = _voice_copies(parsed)
+        rom_copies.setdefault(pid, []).append(rom_copy)
+        strength_copies.setdefault(pid, []).append(strength_copy)
+
+    patients = cur.execute("SELECT id, rom_entries, strength_entries, created_at FROM patients").fetchall()
+    for pid, rom_json, strength_json, created_at in patients:
+        rom = rom_rows(_strip_copies(loads(rom_json, []), rom_copies.get(pid, [])))
+        strength = strength_rows(_strip_copies(loads(strength_json, []), strength_copies.get(pid, [])))
+        _insert_measurements(cur, pid, rom, strength, measured_at=created_at)
+
+
+# Tables whose writes invalidate cached reads (see query_cache.py)
+VERSIONED_TABLES = ("patients", "sessions", "users", "rom_progress",
+                    "rom_measurements", "strength_measurements")
+
+
+def _add_data_versions(cur: sqlite3.Cursor):
+    # Per-table write counters kept in the DB so every process sees them.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    for table in VERSIONED_TABLES:
+        cur.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 0)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE table_name = '{table}';
+            END
+            """)
+
+
+def _week_sql(ts: str) -> str:
+    # SQL fragment: whole weeks from the patient's (alias p) surgery date - or
+    # record creation if no usable surgery date - to ts, floored (pre-op < 0)
+    days = f"(julianday({ts}) - COALESCE(julianday(p.surgery_date), julianday(p.created_at))) / 7.0"
+    return f"COALESCE(CAST({days} AS INTEGER) - ({days} < CAST({days} AS INTEGER)), 0)"
+
+
+# One statement per source table; {where} narrows to the affected rows and the
+# ON CONFLICT clause adds to an existing (patient, week) bucket, so the same
+# SQL serves the full backfill, the insert triggers and a per-patient rebuild.
+WEEKLY_SUMMARY_SQL = {
+    "sessions": f"""
+        INSERT INTO patient_week_summary (patient_id, week, sessions, pain_sum, pain_n)
+        SELECT s.patient_id, {_week_sql("s.created_at")} AS wk,
+               COUNT(*), TOTAL(s.pain_level), COUNT(s.pain_level)
+        FROM sessions s JOIN patients p ON p.id = s.patient_id
+        WHERE {{where}}
+        GROUP BY s.patient_id, wk
+        ON CONFLICT (patient_id, week) DO UPDATE SET
+            sessions = sessions + excluded.sessions,
+            pain_sum = pain_sum + excluded.pain_sum,
+            pain_n = pain_n + excluded.pain_n
+    """,
+    "rom_measurements": f"""
+        INSERT INTO patient_week_summary (patient_id, week, rom_sum, rom_n)
+        SELECT m.patient_id, {_week_sql("m.measured_at")} AS wk,
+               TOTAL(COALESCE(m.end_value, m.active)), COUNT(COALESCE(m.end_value, m.active))
+        FROM rom_measurements m JOIN patients p ON p.id = m.patient_id
+        WHERE COALESCE(m.end_value, m.active) IS NOT NULL AND {{where}}
+        GROUP BY m.patient_id, wk
+        ON CONFLICT (patient_id, week) DO UPDATE SET
+            rom_sum = rom_sum + excluded.rom_sum,
+            rom_n = rom_n + excluded.rom_n
+    """,
+    "strength_measurements": f"""
+        INSERT INTO patient_week_summary (patient_id, week, strength_sum, strength_n)
+        SELECT m.patient_id, {_week_sql("m.measured_at")} AS wk, TOTAL(m.grade), COUNT(m.grade)
+        FROM strength_measurements m JOIN patients p ON p.id = m.patient_id
+        WHERE m.grade IS NOT NULL AND {{where}}
+        GROUP BY m.patient_id, wk
+        ON CONFLICT (patient_id, week) DO UPDATE SET
+            strength_sum = strength_sum + excluded.strength_sum,
+            strength_n = strength_n + excluded.strength_n
+    """,
+}
+_SUMMARY_ALIASES = {"sessions": "s", "rom_measurements": "m", "strength_measurements": "m"}
+
+
+def _add_weekly_summary(cur: sqlite3.Cursor):
+    """
+    Materialized per-patient, per-week totals for the cohort analytics page
+    (weeks counted from surgery_date). Sums and counts rather than means, so
+    an insert trigger only has to add one row's values to its bucket; updates
+    and deletes are handled by _add_weekly_summary_maintenance. Changing a
+    patient's surgery_date moves every reading to another week, so that
+    patient is rebuilt.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS patient_week_summary (
+        patient_id INTEGER NOT NULL,
+        week INTEGER NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        pain_sum REAL NOT NULL DEFAULT 0,
+        pain_n INTEGER NOT NULL DEFAULT 0,
+        rom_sum REAL NOT NULL DEFAULT 0,
+        rom_n INTEGER NOT NULL DEFAULT 0,
+        strength_sum REAL NOT NULL DEFAULT 0,
+        strength_n INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (patient_id, week)
+    ) WITHOUT ROWID
+    """)
+    for table, sql in WEEKLY_SUMMARY_SQL.items():
+        cur.execute(sql.format(where="1"))
+        alias = _SUMMARY_ALIASES[table]
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_week_summary AFTER INSERT ON {table} BEGIN
+            {sql.format(where=f"{alias}.rowid = NEW.rowid")};
+        END
+        """)
+    rebuild = ";\n".join(sql.format(where="p.id = NEW.id") for sql in WEEKLY_SUMMARY_SQL.values())
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS patients_week_summary_rebuild
+    AFTER UPDATE OF surgery_date, created_at ON patients BEGIN
+        DELETE FROM patient_week_summary WHERE patient_id = NEW.id;
+        {rebuild};
+    END
+    """)
+
+
+# table -> (timestamp column, its columns in patient_week_summary reset to
+# zero before the bucket is recomputed, columns an update must change to move
+# or alter a bucket)
+_SUMMARY_SOURCES = {
+    "sessions": ("created_at", "sessions = 0, pain_sum = 0, pain_n = 0",
+                 "patient_id, created_at, pain_level"),
+    "rom_measurements": ("measured_at", "rom_sum = 0, rom_n = 0",
+                         "patient_id, measured_at, end_value, active"),
+    "strength_measurements": ("measured_at", "strength_sum = 0, strength_n = 0",
+                              "patient_id, measured_at, grade"),
+}
+
+
+def _recompute_week_sql(table: str, row: str) -> str:
+    # Trigger body: recompute this table's share of the (patient, week) bucket
+    # that row (OLD or NEW) falls in, then drop the patient's emptied buckets.
+    ts, zero, _ = _SUMMARY_SOURCES[table]
+    alias = _SUMMARY_ALIASES[table]
+    week = f"(SELECT {_week_sql(f'{row}.{ts}')} FROM patients p WHERE p.id = {row}.patient_id)"
+    where = f"{alias}.patient_id = {row}.patient_id AND {_week_sql(f'{alias}.{ts}')} = {week}"
+    return f"""
+        UPDATE patient_week_summary SET {zero}
+        WHERE patient_id = {row}.patient_id AND week = {week};
+        {WEEKLY_SUMMARY_SQL[table].format(where=where)};
+        DELETE FROM patient_week_summary
+        WHERE patient_id = {row}.patient_id AND sessions = 0 AND rom_n = 0 AND strength_n = 0;
+    """
+
+
+def _add_weekly_summary_maintenance(cur: sqlite3.Cursor):
+    """
+    Keep patient_week_summary correct when sessions or measurements are
+    updated or deleted, not just inserted: the bucket the old row sat in and
+    the one the new row lands in are recomputed from the source table.
+    Deleting a patient drops their buckets.
+    """
+    for table, (_, _, columns) in _SUMMARY_SOURCES.items():
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_week_summary_update
+        AFTER UPDATE OF {columns} ON {table} BEGIN
+            {_recompute_week_sql(table, "OLD")}
+            {_recompute_week_sql(table, "NEW")}
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_week_summary_delete AFTER DELETE ON {table} BEGIN
+            {_recompute_week_sql(table, "OLD")}
+        END
+        """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS patients_week_summary_delete AFTER DELETE ON patients BEGIN
+        DELETE FROM patient_week_summary WHERE patient_id = OLD.id;
+    END
+    """)
+
+
+MIGRATIONS = [
+    _create_tables,            # 1: base tables (IF NOT EXISTS, so pre-versioned DBs pass through)
+    _add_history_indexes,      # 2
+    _add_patient_name_index,   # 3
+    _add_notes_fts,            # 4
+    _add_measurement_tables,   # 5
+    _add_data_versions,        # 6
+    _add_weekly_summary,       # 7
+    _add_weekly_summary_maintenance,  # 8
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# ---------- Read cache ----------
+def get_data_versions(tables) -> tuple:
+    """
+    Write counters for the given tables, in the order given, as seen by this
+    thread's analytics connection - inside a read_snapshot() block, the
+    counters of that snapshot.
+    """
+    tables = tuple(tables)
+    placeholders = ",".join("?" * len(tables))
+    rows = dict(get_analytics_conn().execute(
+        f"SELECT table_name, version FROM data_versions WHERE table_name IN ({placeholders})", tables
+    ).fetchall())
+    return tuple(rows.get(t) for t in tables)
+
+
+# Reads below are served from here until a write touches one of their tables.
+# Each runs in one read_snapshot() together with its version lookup, so a
+# cached read must query through get_analytics_conn().
+read_cache = QueryCache(version_source=get_data_versions, scope=lambda: DB_FILE, snapshot=read_snapshot)
+
+# ---------- Patient CRUD ----------
+# Column list and INSERT statement for patients, built once per schema.
+# Keyed on (DB_FILE, PRAGMA schema_version) so any ALTER/CREATE invalidates it.
+_patient_insert_cache: Dict[tuple, tuple] = {}
 
-    # get current columns in patients table
-    cur.execute("PRAGMA table_info(patients)")
-    columns_info = cur.fetchall()
-    columns = [col[1] for col in columns_info if col[1] not in ("id", "created_at")]
 
+def _patient_insert_sql(conn: sqlite3.Connection) -> tuple:
+    """Return (columns, sql) for inserting into patients, from cache when the schema is unchanged."""
+    key = (DB_FILE, conn.execute("PRAGMA schema_version").fetchone()[0])
+    cached = _patient_insert_cache.get(key)
+    if cached is None:
+        cur = conn.execute("PRAGMA table_info(patients)")
+        columns = [col[1] for col in cur.fetchall() if col[1] not in ("id", "created_at")]
+        placeholders = ",".join(["?"] * len(columns))
+        sql = f"INSERT INTO patients ({', '.join(columns)}) VALUES ({placeholders})"
+        _patient_insert_cache.clear()
+        cached = _patient_insert_cache[key] = (columns, sql)
+    return cached
+
+
+def _patient_values(rec: Dict[str, Any], columns: List[str]) -> tuple:
     values = []
     for col in columns:
         if col in ("rom_entries", "strength_entries"):
             values.append(json.dumps(rec.get(col) or []))
         else:
             values.append(rec.get(col))
+    return tuple(values)
+
+
+def _inserted_ids(conn: sqlite3.Connection, count: int) -> List[int]:
+    # executemany only reports the last rowid; inside one write transaction on an
+    # AUTOINCREMENT table the rows before it got the consecutive ids below it.
+    last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last - count + 1, last + 1))
+
+
+def add_patient_from_record(rec: Dict[str, Any]) -> int:
+    """
+    Dynamically insert a patient record based on current DB columns.
+    """
+    with transaction() as conn:
+        columns, sql = _patient_insert_sql(conn)
+        cur = conn.execute(sql, _patient_values(rec, columns))
+        pid = cur.lastrowid
+        _insert_measurements(conn, pid, rom_rows(rec.get("rom_entries")),
+                             strength_rows(rec.get("strength_entries")))
+        return pid
 
-    placeholders = ",".join(["?"] * len(columns))
-    sql = f"INSERT INTO patients ({', '.join(columns)}) VALUES ({placeholders})"
 
-    cur.execute(sql, tuple(values))
-    pid = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return pid
+def add_patients_bulk(records: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert many patient records in a single transaction. Returns the new ids in input order.
+    """
+    if not records:
+        return []
+    with transaction() as conn:
+        columns, sql = _patient_insert_sql(conn)
+        conn.executemany(sql, (_patient_values(rec, columns) for rec in records))
+        ids = _inserted_ids(conn, len(records))
+        for pid, rec in zip(ids, records):
+            _insert_measurements(conn, pid, rom_rows(rec.get("rom_entries")),
+                                 strength_rows(rec.get("strength_entries")))
+        return ids
 
+@read_cache.cached("patients")
 def get_all_patients() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_analytics_conn().cursor()
     cur.execute("SELECT * FROM patients ORDER BY id DESC")
     rows = cur.fetchall()
     cols = [c[0] for c in cur.description]
-    conn.close()
     return [dict(zip(cols, r)) for r in rows]
 
+@read_cache.cached("patients")
 def get_patient(patient_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_analytics_conn().cursor()
     cur.execute("SELECT * FROM patients WHERE id = ?", (patient_id,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
     cols = [c[0] for c in cur.description]
     return dict(zip(cols, row))
 
+@read_cache.cached("patients")
 def find_patient_by_name(name: str) -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_analytics_conn().cursor()
     cur.execute("SELECT * FROM patients WHERE name LIKE ? COLLATE NOCASE", (f"%{name}%",))
     rows = cur.fetchall()
     cols = [c[0] for c in cur.description]
-    conn.close()
     return [dict(zip(cols, r)) for r in rows]
 
-def update_patient_fields(patient_id: int, updates: Dict[str, Any]) -> bool:
-    conn = get_conn()
+# ---------- Paged patient listing ----------
+# (PATIENT_LIST_COLUMNS / PATIENT_SORT_KEYS live in record_schema)
+def _patient_filter_sql(filters: Optional[Dict[str, Any]], known: set) -> tuple:
+    """
+    WHERE clauses for list_patients/count_patients. Strings match as a
+    case-insensitive substring, (lo, hi) tuples as an inclusive range,
+    anything else by equality.
+    """
+    where: List[str] = []
+    args: List[Any] = []
+    for col, value in (filters or {}).items():
+        if col not in known:
+            raise ValueError(f"Unknown patient column: {col}")
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            where.append(f"{col} LIKE ? COLLATE NOCASE")
+            args.append(f"%{value}%")
+        elif isinstance(value, tuple):
+            lo, hi = value
+            if lo is not None:
+                where.append(f"{col} >= ?")
+                args.append(lo)
+            if hi is not None:
+                where.append(f"{col} <= ?")
+                args.append(hi)
+        else:
+            where.append(f"{col} = ?")
+            args.append(value)
+    return where, args
+
+
+def _known_patient_columns(conn: sqlite3.Connection) -> set:
+    columns, _ = _patient_insert_sql(conn)
+    return set(columns) | {"id", "created_at"}
+
+
+@read_cache.cached("patients")
+def list_patients(columns: Optional[List[str]] = None, after_id: Optional[int] = None,
+                  limit: Optional[int] = 50, filters: Optional[Dict[str, Any]] = None,
+                  order_by: str = "id", descending: bool = True,
+                  after_value: Any = None) -> List[Dict[str, Any]]:
+    """
+    One page of patients, filtered, sorted and projected in SQL.
+
+    Keyset pagination: pass the last row's id as after_id (and, when sorting
+    by anything other than id, its order_by value as after_value) to get the
+    next page. limit=None returns every matching row.
+    """
+    conn = get_analytics_conn()
+    known = _known_patient_columns(conn)
+    if order_by not in PATIENT_SORT_KEYS:
+        raise ValueError(f"Cannot sort patients by: {order_by}")
+    cols = list(columns or PATIENT_LIST_COLUMNS)
+    for col in cols:
+        if col not in known:
+            raise ValueError(f"Unknown patient column: {col}")
+    for col in ("id", order_by):
+        if col not in cols:
+            cols.append(col)
+
+    where, args = _patient_filter_sql(filters, known)
+    key = PATIENT_SORT_KEYS[order_by]
+    if after_id is not None:
+        # Rows strictly after (after_value, after_id) in (key, id) order.
+        # NULLs sort first ascending and last descending, as SQLite does.
+        if order_by == "id":
+            where.append("id < ?" if descending else "id > ?")
+            args.append(after_id)
+        elif after_value is None:
+            if descending:
+                where.append(f"({key} IS NULL AND id < ?)")
+            else:
+                where.append(f"({key} IS NULL AND id > ?) OR {key} IS NOT NULL")
+            args.append(after_id)
+        elif descending:
+            where.append(f"({key} < ? OR ({key} = ? AND id < ?) OR {key} IS NULL)")
+            args += [after_value, after_value, after_id]
+        else:
+            where.append(f"({key} > ? OR ({key} = ? AND id > ?))")
+            args += [after_value, after_value, after_id]
+
+    direction = "DESC" if descending else "ASC"
+    sql = f"SELECT {', '.join(cols)} FROM patients"
+    if where:
+        sql += " WHERE " + " AND ".join(f"({w})" for w in where)
+    if order_by == "id":
+        sql += f" ORDER BY id {direction}"
+    else:
+        sql += f" ORDER BY {key} {direction}, id {direction}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        args.append(int(limit))
+
     cur = conn.cursor()
+    cur.execute(sql, args)
+    rows = cur.fetchall()
+    names = [c[0] for c in cur.description]
+    return [dict(zip(names, r)) for r in rows]
+
+
+@read_cache.cached("patients")
+def count_patients(filters: Optional[Dict[str, Any]] = None) -> int:
+    conn = get_analytics_conn()
+    where, args = _patient_filter_sql(filters, _known_patient_columns(conn))
+    sql = "SELECT COUNT(*) FROM patients"
+    if where:
+        sql += " WHERE " + " AND ".join(f"({w})" for w in where)
+    return conn.execute(sql, args).fetchone()[0]
+
+# ---------- Full-text search ----------
+def _fts_query(text: str) -> str:
+    """
+    Turn free user input into a safe FTS5 query: every word must match,
+    a trailing * keeps prefix search (e.g. "swell*").
+    """
+    terms = re.findall(r"\w+\*?", text)
+    return " ".join(f'"{t[:-1]}"*' if t.endswith("*") else f'"{t}"' for t in terms)
+
+
+@read_cache.cached("sessions", "patients")
+def search_notes(query: str, patient_id: Optional[int] = None, limit: int = 50,
+                 since: Optional[str] = None, highlight: tuple = ("**", "**")) -> List[Dict[str, Any]]:
+    """
+    Ranked full-text search over session transcripts and patient note columns.
+
+    Returns dicts with source ("session" or "patient"), source_id, patient_id,
+    name, created_at and a highlighted snippet, best match first.
+    `since` is an ISO date/time string compared against created_at.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    start, end = highlight
+
+    session_where = ["sessions_fts MATCH ?"]
+    session_args: List[Any] = [start, end, match]
+    patient_where = ["patients_fts MATCH ?"]
+    patient_args: List[Any] = [start, end, match]
+    if patient_id is not None:
+        session_where.append("s.patient_id = ?")
+        session_args.append(int(patient_id))
+        patient_where.append("p.id = ?")
+        patient_args.append(int(patient_id))
+    if since:
+        session_where.append("s.created_at >= ?")
+        session_args.append(since)
+        patient_where.append("p.created_at >= ?")
+        patient_args.append(since)
+
+    sql = f"""
+        SELECT 'session' AS source, s.id AS source_id, s.patient_id AS patient_id, p.name AS name,
+               s.created_at AS created_at,
+               snippet(sessions_fts, 0, ?, ?, '…', 16) AS snippet,
+               bm25(sessions_fts) AS score
+        FROM sessions_fts
+        JOIN sessions s ON s.id = sessions_fts.rowid
+        LEFT JOIN patients p ON p.id = s.patient_id
+        WHERE {" AND ".join(session_where)}
+        UNION ALL
+        SELECT 'patient', p.id, p.id, p.name, p.created_at,
+               snippet(patients_fts, -1, ?, ?, '…', 16),
+               bm25(patients_fts)
+        FROM patients_fts
+        JOIN patients p ON p.id = patients_fts.rowid
+        WHERE {" AND ".join(patient_where)}
+        ORDER BY score
+        LIMIT ?
+    """
+    cur = get_analytics_conn().cursor()
+    cur.execute(sql, (*session_args, *patient_args, int(limit)))
+    rows = cur.fetchall()
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, r)) for r in rows]
+
+def update_patient_fields(patient_id: int, updates: Dict[str, Any]) -> bool:
     keys = []
     vals = []
     for k, v in updates.items():
@@ -164,36 +960,286 @@ def update_patient_fields(patient_id: int, updates: Dict[str, Any]) -> bool:
             vals.append(v)
         keys.append(f"{k} = ?")
     if not keys:
-        conn.close()
         return False
     sql = "UPDATE patients SET " + ", ".join(keys) + " WHERE id = ?"
     vals.append(patient_id)
-    cur.execute(sql, tuple(vals))
-    conn.commit()
-    changed = cur.rowcount > 0
-    conn.close()
-    return changed
+    with transaction() as conn:
+        cur = conn.execute(sql, tuple(vals))
+        return cur.rowcount > 0
 
 # ---------- Sessions ----------
 def add_session(patient_id: int, transcript: str, parsed: Dict[str, Any], pain_level: Optional[int] = None) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
     parsed_json = json.dumps(parsed)
-    cur.execute("""
-        INSERT INTO sessions (patient_id, transcript, parsed_json, pain_level) VALUES (?,?,?,?)
-    """, (patient_id, transcript, parsed_json, pain_level))
-    sid = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return sid
+    rom, strength = session_measurements(parsed)
+    with transaction() as conn:
+        cur = conn.execute("""
+            INSERT INTO sessions (patient_id, transcript, parsed_json, pain_level) VALUES (?,?,?,?)
+        """, (patient_id, transcript, parsed_json, pain_level))
+        sid = cur.lastrowid
+        _insert_measurements(conn, patient_id, rom, strength, session_id=sid)
+        return sid
+
+def apply_session_updates(patient_id: int, transcript: str, parsed: Dict[str, Any],
+                          updates: Dict[str, Any], pain_level: Optional[int] = None) -> int:
+    """
+    Save a session together with its patient field updates in one transaction.
+    ROM/strength readings in `parsed` are appended as measurement rows; the
+    patient's stored history is not read or rewritten, so the cost does not
+    grow with it. Raises LookupError if the patient does not exist.
+    """
+    with transaction() as conn:
+        if updates:
+            if not update_patient_fields(patient_id, updates):
+                raise LookupError(f"No patient with id {patient_id}")
+        elif conn.execute("SELECT 1 FROM patients WHERE id = ?", (patient_id,)).fetchone() is None:
+            raise LookupError(f"No patient with id {patient_id}")
+        return add_session(patient_id, transcript, parsed, pain_level)
+
+def add_sessions_bulk(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert many sessions in a single transaction. Each row is a dict with
+    patient_id, transcript, parsed, pain_level and optionally created_at
+    (kept as-is for historical imports). Returns the new ids in input order.
+    """
+    if not rows:
+        return []
+    params = [
+        (r["patient_id"], r.get("transcript"), json.dumps(r.get("parsed") or {}),
+         r.get("pain_level"), r.get("created_at"))
+        for r in rows
+    ]
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO sessions (patient_id, transcript, parsed_json, pain_level, created_at)
+            VALUES (?,?,?,?,COALESCE(?, CURRENT_TIMESTAMP))
+        """, params)
+        ids = _inserted_ids(conn, len(params))
+        for sid, r in zip(ids, rows):
+            rom, strength = session_measurements(r.get("parsed") or {})
+            _insert_measurements(conn, r["patient_id"], rom, strength,
+                                 session_id=sid, measured_at=r.get("created_at"))
+        return ids
 
+@read_cache.cached("sessions")
 def get_sessions_for_patient(patient_id: int) -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_analytics_conn().cursor()
     cur.execute("SELECT * FROM sessions WHERE patient_id = ? ORDER BY created_at DESC", (patient_id,))
     rows = cur.fetchall()
     cols = [c[0] for c in cur.description]
-    conn.close()
+    return [dict(zip(cols, r)) for r in rows]
+
+@read_cache.cached("sessions", "strength_measurements")
+def get_session_series(patient_id: int) -> List[Dict[str, Any]]:
+    """
+    Chart series for one patient, oldest first: created_at, pain_level and the
+    first strength grade recorded in each session.
+    """
+    cur = get_analytics_conn().cursor()
+    cur.execute("""
+        SELECT s.id, s.created_at, s.pain_level,
+               (SELECT m.grade FROM strength_measurements m
+                WHERE m.session_id = s.id
+                ORDER BY m.id LIMIT 1) AS strength
+        FROM sessions s
+        WHERE s.patient_id = ?
+        ORDER BY s.created_at ASC, s.id ASC
+    """, (patient_id,))
+    rows = cur.fetchall()
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, r)) for r in rows]
+
+@read_cache.cached("patients", "sessions", "rom_measurements", "strength_measurements")
+def get_patient_timeline(patient_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Everything the charts and the PDF report need for one patient, read from a
+    single snapshot: the patient row, sessions oldest first (id, created_at,
+    pain_level, transcript, first strength grade) and all ROM readings.
+    None if the patient does not exist.
+    """
+    with read_snapshot() as conn:  # one snapshot for all three queries
+        cur = conn.execute("SELECT * FROM patients WHERE id = ?", (patient_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        patient = dict(zip([c[0] for c in cur.description], row))
+
+        cur = conn.execute("""
+            SELECT s.id, s.created_at, s.pain_level, s.transcript,
+                   (SELECT m.grade FROM strength_measurements m
+                    WHERE m.session_id = s.id
+                    ORDER BY m.id LIMIT 1) AS strength
+            FROM sessions s
+            WHERE s.patient_id = ?
+            ORDER BY s.created_at ASC, s.id ASC
+        """, (patient_id,))
+        cols = [c[0] for c in cur.description]
+        sessions = [dict(zip(cols, r)) for r in cur.fetchall()]
+
+        cur = conn.execute("""
+            SELECT session_id, joint, active, passive, start_value, end_value, measured_at
+            FROM rom_measurements
+            WHERE patient_id = ?
+            ORDER BY measured_at, id
+        """, (patient_id,))
+        cols = [c[0] for c in cur.description]
+        rom = [dict(zip(cols, r)) for r in cur.fetchall()]
+    return {"patient": patient, "sessions": sessions, "rom": rom}
+
+@read_cache.cached("patients", "sessions")
+def get_patient_ids_seen(since: Optional[str] = None, until: Optional[str] = None) -> List[int]:
+    """
+    Ids (ascending) of patients with at least one session where
+    since <= created_at < until; either bound may be omitted. Each patient is
+    one range seek on idx_sessions_patient_created.
+    """
+    cond, args = "", []
+    if since:
+        cond += " AND s.created_at >= ?"
+        args.append(since)
+    if until:
+        cond += " AND s.created_at < ?"
+        args.append(until)
+    rows = get_analytics_conn().execute(f"""
+        SELECT p.id FROM patients p
+        WHERE EXISTS (SELECT 1 FROM sessions s WHERE s.patient_id = p.id{cond})
+        ORDER BY p.id
+    """, args).fetchall()
+    return [r[0] for r in rows]
+
+
+@read_cache.cached("patients", "sessions", "rom_measurements", "strength_measurements")
+def get_weekly_summary() -> Dict[str, List[Any]]:
+    """
+    The materialized per-patient, per-week totals (see _add_weekly_summary)
+    joined with each patient's procedure, as columns: {name: [values...]}
+    ordered by patient and week. Columnar so the cohort page can hand it
+    straight to pandas.
+    """
+    cur = get_analytics_conn().execute("""
+        SELECT w.patient_id, p.surgical_procedure, w.week, w.sessions, w.pain_sum, w.pain_n,
+               w.rom_sum, w.rom_n, w.strength_sum, w.strength_n
+        FROM patient_week_summary w JOIN patients p ON p.id = w.patient_id
+        ORDER BY w.patient_id, w.week
+    """)
+    rows = cur.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * len(WEEKLY_SUMMARY_COLUMNS)
+    return {name: list(values) for name, values in zip(WEEKLY_SUMMARY_COLUMNS, columns)}
+
+def _fmt_num(col: str) -> str:
+    # SQL fragment: number without trailing .0, or ? when missing
+    return f"CASE WHEN {col} IS NULL THEN '?' ELSE printf('%g', {col}) END"
+
+
+# Display columns shared by the session history views; {notes} and {order}
+# are filled in per view.
+_SESSION_HISTORY_SQL = f"""
+    SELECT s.id,
+           strftime('%Y-%m-%d %H:%M', s.created_at) AS date,
+           s.pain_level,
+           (SELECT r.joint || ': ' ||
+                   CASE WHEN r.start_value IS NOT NULL OR r.end_value IS NOT NULL
+                        THEN {_fmt_num("r.start_value")} || '→' || {_fmt_num("r.end_value")} || '°'
+                        ELSE 'A ' || {_fmt_num("r.active")} || ' / P ' || {_fmt_num("r.passive")}
+                   END
+            FROM rom_measurements r WHERE r.session_id = s.id
+            ORDER BY r.id LIMIT 1) AS rom_summary,
+           (SELECT m.muscle_group || ' (' || {_fmt_num("m.grade")} || ')'
+            FROM strength_measurements m WHERE m.session_id = s.id
+            ORDER BY m.id LIMIT 1) AS strength_summary,
+           {{notes}} AS notes
+    FROM sessions s
+    WHERE s.patient_id = :pid
+    ORDER BY {{order}}
+"""
+
+
+@read_cache.cached("sessions", "rom_measurements", "strength_measurements")
+def get_session_history(patient_id: int, notes_chars: int = 120) -> List[Dict[str, Any]]:
+    """
+    Display-ready session history, newest first: id, date, pain_level,
+    rom_summary / strength_summary (first reading of each session) and notes
+    cut to notes_chars. All formatting happens in SQL.
+    """
+    cur = get_analytics_conn().cursor()
+    cur.execute(_SESSION_HISTORY_SQL.format(
+        notes="""CASE WHEN length(s.transcript) > :n
+                      THEN substr(s.transcript, 1, :n - 3) || '...'
+                      ELSE s.transcript
+                 END""",
+        order="s.created_at DESC, s.id DESC",
+    ), {"pid": patient_id, "n": int(notes_chars)})
+    rows = cur.fetchall()
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, r)) for r in rows]
+
+def iter_session_history(patient_id: int, batch: int = 500) -> Iterator[Dict[str, Any]]:
+    """
+    The complete session history, oldest first, streamed: same columns as
+    get_session_history but with the full notes. Rows are fetched batch at a
+    time from one cursor, so memory stays flat however long the history is.
+    Not cached (that would hold the whole history). The cursor holds its
+    read snapshot until the stream is exhausted or closed, so it runs on a
+    connection of its own rather than pinning the thread's shared analytics
+    connection (and every cached read on it) to that snapshot meanwhile.
+    """
+    init_db()
+    conn = _open_analytics_conn(DB_FILE)
+    try:
+        cur = conn.cursor()
+        cur.execute(_SESSION_HISTORY_SQL.format(notes="s.transcript", order="s.created_at ASC, s.id ASC"),
+                    {"pid": patient_id})
+        cols = [c[0] for c in cur.description]
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            for r in rows:
+                yield dict(zip(cols, r))
+    finally:
+        conn.close()
+
+# ---------- ROM / strength measurements ----------
+def _insert_measurements(conn, patient_id: int, rom: List[tuple], strength: List[tuple],
+                         session_id: Optional[int] = None, measured_at: Optional[str] = None):
+    """Insert measurement rows; runs inside the caller's transaction."""
+    if rom:
+        conn.executemany("""
+            INSERT INTO rom_measurements
+                (patient_id, session_id, joint, active, passive, start_value, end_value, measured_at)
+            VALUES (?,?,?,?,?,?,?,COALESCE(?, CURRENT_TIMESTAMP))
+        """, [(patient_id, session_id, *r, measured_at) for r in rom])
+    if strength:
+        conn.executemany("""
+            INSERT INTO strength_measurements (patient_id, session_id, muscle_group, grade, measured_at)
+            VALUES (?,?,?,?,COALESCE(?, CURRENT_TIMESTAMP))
+        """, [(patient_id, session_id, *s, measured_at) for s in strength])
+
+
+@read_cache.cached("rom_measurements")
+def get_rom_measurements(patient_id: int, joint: Optional[str] = None) -> List[Dict[str, Any]]:
+    sql = "SELECT * FROM rom_measurements WHERE patient_id = ?"
+    args: List[Any] = [patient_id]
+    if joint:
+        sql += " AND joint = ?"
+        args.append(joint)
+    cur = get_analytics_conn().cursor()
+    cur.execute(sql + " ORDER BY measured_at, id", args)
+    rows = cur.fetchall()
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, r)) for r in rows]
+
+
+@read_cache.cached("strength_measurements")
+def get_strength_measurements(patient_id: int, muscle_group: Optional[str] = None) -> List[Dict[str, Any]]:
+    sql = "SELECT * FROM strength_measurements WHERE patient_id = ?"
+    args: List[Any] = [patient_id]
+    if muscle_group:
+        sql += " AND muscle_group = ?"
+        args.append(muscle_group)
+    cur = get_analytics_conn().cursor()
+    cur.execute(sql + " ORDER BY measured_at, id", args)
+    rows = cur.fetchall()
+    cols = [c[0] for c in cur.description]
     return [dict(zip(cols, r)) for r in rows]
 
 # ---------- Users ----------
@@ -201,51 +1247,37 @@ def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode("utf-8")).hexdigest()
 
 def add_user(username: str, password: str) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
     try:
-        cur.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                    (username, hash_password(password)))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                         (username, hash_password(password)))
         return True
     except Exception:
         return False
-    finally:
-        conn.close()
 #---------range of motion table ------
 def add_rom_progress(patient_id, rom_type, start_value, end_value):
-    conn = sqlite3.connect("physio.db")
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO rom_progress (patient_id, rom_type, start_value, end_value, created_at)
-        VALUES (?, ?, ?, ?, datetime('now'))
-    """, (patient_id, rom_type, start_value, end_value))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO rom_progress (patient_id, rom_type, start_value, end_value, created_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+        """, (patient_id, rom_type, start_value, end_value))
 # ----------loader for graphs -------
+@read_cache.cached("rom_progress")
 def get_rom_progress(patient_id):
-    conn = sqlite3.connect("physio.db")
-    cur = conn.cursor()
+    cur = get_analytics_conn().cursor()
     cur.execute("""
         SELECT created_at, rom_type, start_value, end_value
         FROM rom_progress
         WHERE patient_id = ?
         ORDER BY created_at ASC
     """, (patient_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    return cur.fetchall()
 
 
 def verify_user(username: str, password: str) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
+    cur = get_conn().cursor()
     cur.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return False
     return row[0] == hash_password(password)
-
-# Initialize DB on import
-init_db()
@@ -0,0 +1,131 @@
+# import_budget.py
+"""
+Cold-start budget for the Streamlit app, measured with `python -X importtime`.
+
+    python import_budget.py                         # default budgets, best of 3
+    python import_budget.py --cold-ms 250 --page-ms 400 --repeat 5
+
+Each check runs in a fresh interpreter (in a scratch directory, so pysio.db
+is never touched):
+
+  cold start  - the modules main.py imports at the top, *after* streamlit
+                itself (streamlit is the baseline and not budgeted)
+  first page  - cold start plus what the Home page does: open the database
+                and load the patient directory
+
+Both fail if they exceed their budget (milliseconds, best of --repeat runs)
+or if any of HEAVY_MODULES got imported: those belong to the page that needs
+them, not to start-up. The slowest imports from -X importtime are listed so
+a regression can be traced to the module that caused it.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+BASELINE = ["streamlit"]
+APP_MODULES = ["ui_module", "ui_voice", "compat_shim", "patient_directory", "auth_module"]
+HOME_PAGE = "from patient_directory import get_directory; len(get_directory())"
+
+# must not be imported until a page asks for them
+HEAVY_MODULES = ["pandas", "matplotlib", "fpdf", "speech_recognition", "pydub", "data_visualisation",
+                 "pdf_export", "voice_module"]
+
+# page -> module it lazily imports (reported, not budgeted)
+PAGE_MODULES = {
+    "Visualisation Dashboard": "data_visualisation",
+    "Export PDF": "pdf_export",
+    "Voice Notes": "voice_module",
+}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _probe(statements: str) -> str:
+    return (
+        "import sys, json, time\n"
+        "_t = time.perf_counter()\n"
+        f"{statements}\n"
+        "print(json.dumps({'wall_ms': (time.perf_counter() - _t) * 1000, 'modules': sorted(sys.modules)}))\n"
+    )
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, self_us, cumulative_us, depth) for every -X importtime line, in import order."""
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    return rows
+
+
+def run_probe(statements: str, exclude: List[str]) -> Dict:
+    """
+    Run statements in a fresh interpreter with -X importtime. Import time is
+    the cumulative time of every top-level import except those in exclude.
+    """
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=REPO + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _probe(statements)],
+                              cwd=cwd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"probe failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(proc.stderr)
+    result["import_ms"] = sum(cum for name, _, cum, depth in rows
+                              if depth == 0 and name.split(".")[0] not in exclude) / 1000
+    result["slowest"] = sorted(((name, self_us / 1000) for name, self_us, _, _ in rows),
+                               key=lambda r: r[1], reverse=True)[:8]
+    return result
+
+
+def best_of(statements: str, exclude: List[str], repeat: int) -> Dict:
+    runs = [run_probe(statements, exclude) for _ in range(repeat)]
+    return min(runs, key=lambda r: r["import_ms"])
+
+
+def check(label: str, result: Dict, budget_ms: float, cost_key: str) -> bool:
+    cost = result[cost_key]
+    heavy = sorted({m.split(".")[0] for m in result["modules"]} & set(HEAVY_MODULES))
+    ok = cost <= budget_ms and not heavy
+    print(f"{'PASS' if ok else 'FAIL'}  {label:<12} {cost:8.1f} ms (budget {budget_ms:.0f} ms)")
+    if heavy:
+        print(f"      imported too early: {', '.join(heavy)}")
+    for name, ms in result["slowest"]:
+        print(f"        {ms:8.1f} ms  {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cold-ms", type=float, default=300.0, help="budget for app imports after streamlit")
+    parser.add_argument("--page-ms", type=float, default=500.0, help="budget for cold start + Home page")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = "".join(f"import {m}\n" for m in BASELINE)
+    app = "".join(f"import {m}\n" for m in APP_MODULES)
+
+    cold = best_of(baseline + app, BASELINE, args.repeat)
+    ok = check("cold start", cold, args.cold_ms, "import_ms")
+
+    # wall time of the Home page work, measured after the baseline imports
+    page = best_of(baseline + "_t = time.perf_counter()\n" + app + HOME_PAGE, BASELINE, args.repeat)
+    ok = check("first page", page, args.page_ms, "wall_ms") and ok
+
+    print("\nPage-specific imports (loaded on first visit, not budgeted):")
+    for page_name, module in PAGE_MODULES.items():
+        try:
+            r = best_of(baseline + app + f"import {module}", BASELINE + APP_MODULES, 1)
+            print(f"  {page_name:<24} {r['import_ms']:8.1f} ms  ({module})")
+        except RuntimeError as exc:
+            print(f"  {page_name:<24} unavailable: {exc}")
+
+    sys.exit(0 if ok else 1)
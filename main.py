@@ -1,27 +1,34 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime
+import tempfile
+from datetime import datetime, timedelta
 from ui_module import patient_form
-import json # Needed to parse nested session data
 
-# --- UPDATED IMPORTS: ONLY importing the two remaining functions ---
-from data_visualisation import (
-    plot_strength_progress, 
-    plot_pain_trend
-)
-# ------------------------------------------------------------------
+# Heavy stacks load on the page that needs them: matplotlib with the
+# Visualisation Dashboard, fpdf with Export PDF, speech_recognition/pydub with
+# Voice Notes. Check the cold-start budget with: python import_budget.py
 
 from ui_voice import voice_note_ui
 from compat_shim import (
     save_record_sql,
-    load_all_patients_sql,
     load_single_patient_sql,
-    generate_patient_pdf,
+    build_patient_pdf,
     convert_voice_to_text,
     extract_structured_keywords,
     add_session,
-    get_sessions_for_patient # Ensure this is here for the View Patients section
+    search_notes,
+    load_patients_page,
+    next_page_cursor,
+    count_patients,
+    storage_description,
+    use_session_connections,
+    cache_stats,
+    chart_cache_stats,
+    report_cache_stats,
+    load_session_history,
+    load_timeline,
+    load_cohort_frame
 )
+from patient_directory import get_directory
 
 
 # ----------------------------------------------------
@@ -33,6 +40,10 @@ st.set_page_config(
     layout="wide"
 )
 
+# One set of DB connections per browser session, reused by every rerun
+# (each rerun runs on a new thread) and closed when the session ends.
+use_session_connections(st.session_state)
+
 
 # ----------------------------------------------------
 # SIMPLE LOGIN SYSTEM (LOCAL AUTH)
@@ -57,6 +68,11 @@ def login_system():
 
 login_system()
 
+# Compact id/name index shared by every patient picker below. One version
+# check per run picks up other processes' writes; lookups after it are free.
+directory = get_directory()
+directory.sync()
+
 
 # ----------------------------------------------------
 # SIDEBAR NAVIGATION
@@ -65,8 +81,10 @@ page = st.sidebar.radio("Go to:", [
     "Home",
     "Add / Update Patient Session",    # <-- changed
     "View Patients",
+    "Search Notes",
     "Voice Notes",
     "Visualisation Dashboard",
+    "Cohort Analytics",
     "Export PDF",
     "Settings"
 ])
@@ -108,19 +126,56 @@ elif page == "Add Patient":
 elif page == "View Patients":
     st.title("All Patients")
 
-    df = load_all_patients_sql()
-    st.dataframe(df)
+    SORT_OPTIONS = {
+        "Newest first": ("id", True),
+        "Oldest first": ("id", False),
+        "Name (A–Z)": ("name", False),
+        "Name (Z–A)": ("name", True),
+        "Surgery date (recent)": ("surgery_date", True),
+        "Pain level (highest)": ("pain_level", True),
+    }
+
+    f1, f2, f3, f4 = st.columns(4)
+    name_filter = f1.text_input("Filter by name")
+    procedure_filter = f2.text_input("Filter by procedure")
+    sort_label = f3.selectbox("Sort by", list(SORT_OPTIONS))
+    page_size = f4.selectbox("Rows per page", [25, 50, 100], index=1)
+
+    filters = {"name": name_filter.strip(), "surgical_procedure": procedure_filter.strip()}
+    order_by, descending = SORT_OPTIONS[sort_label]
+
+    # Keyset paging: remember the (sort value, id) cursor each visited page started after.
+    # Any change to filters/sort/page size starts again from page one.
+    view_key = (name_filter, procedure_filter, sort_label, page_size)
+    if st.session_state.get("vp_view_key") != view_key:
+        st.session_state["vp_view_key"] = view_key
+        st.session_state["vp_cursors"] = [(None, None)]
+    cursors = st.session_state["vp_cursors"]
+
+    after_value, after_id = cursors[-1]
+    df = load_patients_page(after_id=after_id, after_value=after_value, limit=page_size,
+                            filters=filters, order_by=order_by, descending=descending)
+    total = count_patients(filters)
+
+    st.caption(f"Page {len(cursors)} — {total} matching patients")
+    st.dataframe(df, use_container_width=True)
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("◀ Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next page ▶", disabled=len(df) < page_size):
+        cursors.append(next_page_cursor(df, order_by))
+        st.rerun()
 
     st.subheader("View Specific Patient")
 
-    if not df.empty:
-        patient_ids = df["patient_id"].tolist()
-        picked_id = st.selectbox("Select Patient ID", patient_ids)
+    if len(directory):
+        picked_id = st.selectbox("Select Patient", directory.ids_by_name(), format_func=directory.label)
 
         if st.button("Load Patient"):
             
             patient_data = load_single_patient_sql(picked_id)
-            sessions = get_sessions_for_patient(int(picked_id)) 
             
             st.subheader(f"Patient Demographics: ID {picked_id}")
             # --- UPDATED: Display core info instead of verbose JSON dump ---
@@ -133,70 +188,43 @@ elif page == "View Patients":
             # --- END UPDATED ---
             
             st.subheader("Session History")
-            
-            if sessions:
-                sessions_df = pd.DataFrame(sessions)
-
-                # Helper function to extract summary data from the 'parsed' column
-                def extract_key_metrics(row):
-                    # The 'parsed' column should contain session details
-                    parsed_data = row['parsed']
-                    if isinstance(parsed_data, str):
-                        try:
-                            parsed_data = json.loads(parsed_data)
-                        except json.JSONDecodeError:
-                            return pd.Series({'ROM_Summary': 'N/A', 'Strength_Summary': 'N/A'})
-                    elif not isinstance(parsed_data, dict):
-                        return pd.Series({'ROM_Summary': 'N/A', 'Strength_Summary': 'N/A'})
-                    
-                    # Extract ROM (showing first entry as summary)
-                    rom_entries = parsed_data.get('rom_entries', [])
-                    rom_summary = "N/A"
-                    if rom_entries and isinstance(rom_entries, list) and rom_entries[0]:
-                        first_rom = rom_entries[0]
-                        rom_summary = f"Flex: {first_rom.get('rom', '?')}, Ext: {first_rom.get('extension', '?')}"
-                    
-                    # Extract Strength (showing first entry as summary)
-                    strength_entries = parsed_data.get('strength_entries', [])
-                    strength_summary = "N/A"
-                    if strength_entries and isinstance(strength_entries, list) and strength_entries[0]:
-                        first_strength = strength_entries[0]
-                        muscle = first_strength.get('muscle_group', 'Group')
-                        grade = first_strength.get('grade', '?')
-                        strength_summary = f"{muscle} ({grade})"
-
-                    return pd.Series({
-                        'ROM_Summary': rom_summary, 
-                        'Strength_Summary': strength_summary
-                    })
-
-                # Apply the extraction function to create new columns
-                if 'parsed' in sessions_df.columns:
-                     sessions_df[['ROM_Summary', 'Strength_Summary']] = sessions_df.apply(extract_key_metrics, axis=1)
-                
-                # Format the DataFrame for clean display
-                sessions_df = sessions_df.drop(columns=['parsed', 'patient_id', 'id'], errors='ignore')
-                
-                # Rename and format date column (FIXED: Uses 'created_at' instead of 'timestamp')
-                if 'created_at' in sessions_df.columns:
-                    sessions_df['created_at'] = pd.to_datetime(sessions_df['created_at']).dt.strftime('%Y-%m-%d %H:%M')
-                    sessions_df = sessions_df.rename(columns={
-                        'created_at': 'Date/Time',
-                        'transcript': 'Notes',
-                        'pain_level': 'Pain (0-10)',
-                        'ROM_Summary': 'ROM',
-                        'Strength_Summary': 'Strength'
-                    })
-                
-                # Define the final columns to display
-                display_cols = ['Date/Time', 'Pain (0-10)', 'ROM', 'Strength', 'Notes']
-                final_cols = [col for col in display_cols if col in sessions_df.columns]
-
-                st.dataframe(sessions_df[final_cols], use_container_width=True)
-                
+
+            # Typed, display-ready columns straight from the storage layer
+            sessions_df = load_session_history(picked_id)
+
+            if not sessions_df.empty:
+                st.dataframe(sessions_df, use_container_width=True)
             else:
                 st.info("No session history found for this patient.")
 
+# ----------------------------------------------------
+# SEARCH NOTES PAGE
+# ----------------------------------------------------
+elif page == "Search Notes":
+    st.title("Search Session & Clinical Notes")
+
+    query = st.text_input("Search transcripts and notes", placeholder="e.g. pus, swelling, knee flex*")
+    col1, col2, col3 = st.columns(3)
+    patient_filter = col1.text_input("Patient ID (optional)")
+    use_since = col2.checkbox("Only recent notes")
+    since = col3.date_input("Since", disabled=not use_since)
+
+    if query:
+        results = search_notes(
+            query,
+            patient_id=int(patient_filter) if patient_filter.strip().isdigit() else None,
+            since=str(since) if use_since else None,
+            limit=100
+        )
+        if not results:
+            st.info("No matching notes found.")
+        for r in results:
+            label = "Session" if r["source"] == "session" else "Patient notes"
+            st.markdown(
+                f"**{r['name'] or 'Unknown'}** (ID {r['patient_id']}) — {label}, {r['created_at']}  \n"
+                f"{r['snippet']}"
+            )
+
 # ----------------------------------------------------
 # VOICE NOTES PAGE
 # ----------------------------------------------------
@@ -225,28 +253,64 @@ elif page == "Voice Notes":
 elif page == "Visualisation Dashboard":
     st.title("📊 Patient Data Visualisation")
 
-    df = load_all_patients_sql()
-
-    if df.empty:
+    if not len(directory):
         st.warning("No patients found.")
     else:
-        selected_id = st.selectbox("Select Patient", df["patient_id"].tolist())
+        selected_id = st.selectbox("Select Patient", directory.ids_by_name(), format_func=directory.label)
 
         if st.button("Generate Visualisations"):
             st.info("Generating visualisation charts for Pain and Strength...")
 
-            # --- ONLY calling the two existing functions ---
-            p1 = plot_strength_progress(selected_id)
-            p2 = plot_pain_trend(selected_id)
+            from data_visualisation import plot_strength_progress, plot_pain_trend
+
+            # --- one timeline load shared by both charts ---
+            timeline = load_timeline(selected_id)
+            p1 = plot_strength_progress(timeline)
+            p2 = plot_pain_trend(timeline)
 
             st.success("Charts generated!")
 
-            # --- ONLY including the two existing paths ---
-            imgs = [p1, p2] 
+            # --- PNG bytes straight from the chart cache, no files ---
+            imgs = [("Strength progress", p1), ("Pain trend", p2)]
 
-            for img in imgs:
+            for caption, img in imgs:
                 if img:
-                    st.image(img, caption=img, use_column_width=True)
+                    st.image(img, caption=caption, use_column_width=True)
+
+# ----------------------------------------------------
+# COHORT ANALYTICS PAGE
+# ----------------------------------------------------
+elif page == "Cohort Analytics":
+    st.title("Cohort Analytics")
+    from cohort_analytics import (
+        filter_cohort, pain_trajectory, rom_recovery,
+        strength_gain, strength_gain_distribution
+    )
+
+    cohort = load_cohort_frame()
+    if cohort.empty:
+        st.warning("No session data yet.")
+    else:
+        all_procedures = sorted(cohort["surgical_procedure"].cat.categories)
+        procedures = st.multiselect("Surgical procedure", all_procedures, default=all_procedures)
+        lo, hi = int(cohort["week"].min()), int(cohort["week"].max())
+        weeks = st.slider("Weeks since surgery", lo, hi, (max(lo, -2), min(hi, 52))) if lo < hi else (lo, hi)
+        selected = filter_cohort(cohort, procedures, weeks)
+
+        st.caption(f"{selected['patient_id'].nunique()} patients, {int(selected['sessions'].sum())} sessions")
+
+        st.subheader("Mean pain by week since surgery")
+        st.line_chart(pain_trajectory(selected))
+
+        st.subheader("ROM recovery (mean degrees) by week since surgery")
+        st.line_chart(rom_recovery(selected))
+
+        st.subheader("Strength gain (last minus first weekly MMT grade)")
+        gains = strength_gain(selected)
+        if gains.empty:
+            st.info("Not enough repeated strength readings in this selection.")
+        else:
+            st.bar_chart(strength_gain_distribution(gains))
 
 # ----------------------------------------------------
 # ADD / UPDATE PATIENT SESSION PAGE
@@ -254,17 +318,15 @@ elif page == "Visualisation Dashboard":
 elif page == "Add / Update Patient Session":
     st.title("Add / Update Patient Session")
 
-    # Load existing patients
-    df = load_all_patients_sql()
-    if df.empty:
+    # Existing patients come from the in-memory directory
+    if not len(directory):
         st.warning("No patients found. Please add a new patient first.")
         record = patient_form()
         if record:
             save_record_sql(record)
             st.success("Patient record saved successfully!")
     else:
-        patient_ids = df["patient_id"].tolist()
-        selected_id = st.selectbox("Select Patient", patient_ids)
+        selected_id = st.selectbox("Select Patient", directory.ids_by_name(), format_func=directory.label)
 
         # Option to create a new patient instead
         if st.checkbox("Create a new patient instead"):
@@ -298,15 +360,54 @@ elif page == "Add / Update Patient Session":
 elif page == "Export PDF":
     st.title("Export Patient Record as PDF")
 
-    patients = load_all_patients_sql()
-
-    if not patients.empty:
-        patient_id = st.selectbox("Select Patient ID", patients["patient_id"].tolist())
+    if len(directory):
+        patient_id = st.selectbox("Select Patient", directory.ids_by_name(), format_func=directory.label)
 
+        full_history = st.checkbox("Full session history (every session, complete notes)")
         if st.button("Generate PDF"):
-            pdf_path = generate_patient_pdf(patient_id)
+            # built in memory: no file on disk, no handle left open
+            pdf_bytes = build_patient_pdf(patient_id, full_history=full_history)
             st.success("PDF generated successfully!")
-            st.download_button("Download PDF", open(pdf_path, "rb"), file_name="patient_record.pdf")
+            st.download_button("Download PDF", pdf_bytes, file_name=f"patient_{patient_id}_record.pdf",
+                               mime="application/pdf")
+
+        st.subheader("Batch export (ZIP)")
+        from batch_export import ACTIVE_DAYS, ZIP_MAX_PATIENTS, active_patient_ids, export_zip, patient_ids_seen
+        scope = st.radio("Patients", [f"Active (seen in the last {ACTIVE_DAYS} days)", "Seen in a date range"])
+        if scope.startswith("Seen"):
+            col1, col2 = st.columns(2)
+            date_from = col1.date_input("From")
+            date_to = col2.date_input("To")
+
+        if st.button("Export ZIP"):
+            if scope.startswith("Seen"):
+                ids = patient_ids_seen(date_from, date_to + timedelta(days=1))
+            else:
+                ids = active_patient_ids()
+            if not ids:
+                st.warning("No patients match.")
+            else:
+                if len(ids) > ZIP_MAX_PATIENTS:
+                    st.warning(f"{len(ids)} patients match; exporting the first {ZIP_MAX_PATIENTS}. "
+                               "Narrow the date range for the rest.")
+                    ids = ids[:ZIP_MAX_PATIENTS]
+                bar = st.progress(0.0, text=f"0 / {len(ids)} reports")
+
+                def report_progress(done, total, _pid):
+                    bar.progress(done / total, text=f"{done} / {total} reports")
+
+                # reports are spooled to a temp file as they finish and the file
+                # is handed to the download button, never read in here
+                with tempfile.TemporaryFile() as archive:
+                    result = export_zip(ids, archive, progress=report_progress)
+                    archive.seek(0)
+                    st.success(f"{result['exported']} reports in {result['seconds']:.1f}s "
+                               f"({result['cached']} unchanged, served from cache)")
+                    if result["failed"]:
+                        st.warning(f"{len(result['failed'])} failed: " +
+                                   ", ".join(f"{pid} ({err})" for pid, err in result["failed"].items()))
+                    st.download_button("Download ZIP", archive, file_name="pysio_reports.zip",
+                                       mime="application/zip")
 
 
 # ----------------------------------------------------
@@ -315,7 +416,16 @@ elif page == "Export PDF":
 elif page == "Settings":
     st.title("App Settings")
 
-    st.write("Current Database: PostgreSQL")
+    st.write(f"Current Database: {storage_description()}")
+
+    st.subheader("Read cache")
+    for name, stats in cache_stats().items():
+        st.write(f"{name}: {stats['hits']} hits / {stats['misses']} misses "
+                 f"({stats['hit_rate']:.0%}), {stats['entries']} of {stats['maxsize']} entries")
+    for name, blobs in (("charts", chart_cache_stats()), ("reports", report_cache_stats())):
+        st.write(f"{name}: {blobs['hits']} memory hits / {blobs['disk_hits']} disk hits / "
+                 f"{blobs['misses']} builds, {blobs['entries']} cached "
+                 f"({blobs['bytes'] / 1024:.0f} of {blobs['max_bytes'] / 1024:.0f} KiB)")
     st.write("More settings coming soon…")
 
 
@@ -0,0 +1,156 @@
+# patient_directory.py
+"""
+Compact in-memory index of patients for pickers and id lookups.
+
+Holds only id, name, procedure and surgery date (as __slots__ objects), keyed
+by id with a name-sorted order kept alongside. It loads once per process and
+is patched in place when this process adds or edits a patient. A write from
+anywhere else is picked up by sync(), which compares the backend's data
+version and reloads if it moved; call it once per render. Lookups (label,
+get, len, ids_by_name) are plain dict/list reads that never touch the
+database, so format_func=directory.label costs nothing per option.
+
+    directory = get_directory()
+    directory.sync()                                  # once per script run
+    pid = st.selectbox("Patient", directory.ids_by_name(), format_func=directory.label)
+"""
+import bisect
+import threading
+from typing import Any, Dict, List, Optional
+
+from storage_backend import StorageBackend, get_backend
+
+DIRECTORY_COLUMNS = ["id", "name", "surgical_procedure", "surgery_date"]
+
+
+class PatientEntry:
+    __slots__ = ("id", "name", "surgical_procedure", "surgery_date")
+
+    def __init__(self, id: int, name: Optional[str], surgical_procedure: Optional[str] = None,
+                 surgery_date: Optional[str] = None):
+        self.id = id
+        self.name = name
+        self.surgical_procedure = surgical_procedure
+        self.surgery_date = surgery_date
+
+    @property
+    def sort_key(self) -> tuple:
+        return ((self.name or "").lower(), self.id)
+
+    @property
+    def label(self) -> str:
+        return f"{self.id} — {self.name or 'Unnamed'}"
+
+
+class PatientDirectory:
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or get_backend()
+        self._lock = threading.RLock()
+        self._by_id: Dict[int, PatientEntry] = {}
+        self._order: List[tuple] = []        # sorted (name.lower(), id)
+        self._names_cache: Optional[List[int]] = None
+        self._version: Any = None
+
+    # ---------- loading ----------
+    def _version_now(self) -> Any:
+        return self.backend.data_version(("patients",))
+
+    def reload(self) -> None:
+        with self._lock:
+            version = self._version_now()
+            rows = self.backend.list_patients(columns=DIRECTORY_COLUMNS, limit=None,
+                                              order_by="id", descending=False)
+            self._by_id = {r["id"]: PatientEntry(r["id"], r.get("name"), r.get("surgical_procedure"),
+                                                 r.get("surgery_date")) for r in rows}
+            self._order = sorted(e.sort_key for e in self._by_id.values())
+            self._names_cache = None
+            self._version = version
+
+    def sync(self) -> None:
+        """Reload if any process wrote to patients since we last looked (one version query)."""
+        with self._lock:
+            if self._version is None or self._version_now() != self._version:
+                self.reload()
+
+    def _ensure_loaded(self) -> None:
+        # first use only; afterwards lookups never query
+        if self._version is None:
+            self.reload()
+
+    # ---------- incremental updates ----------
+    def upsert(self, patient_id: int) -> None:
+        """
+        Refresh one patient after this process inserted or edited it. If other
+        writes slipped in meanwhile the version won't line up and the next
+        sync() reloads everything.
+        """
+        with self._lock:
+            before = self._version
+            row = self.backend.get_patient(int(patient_id))
+            after = self._version_now()
+            self._remove(int(patient_id))
+            if row:
+                self._insert(PatientEntry(row["id"], row.get("name"), row.get("surgical_procedure"),
+                                          row.get("surgery_date")))
+            # exactly one patients write since our last sync -> it was ours
+            if before is not None and _advanced_by_one(before, after):
+                self._version = after
+
+    def _insert(self, entry: PatientEntry) -> None:
+        self._by_id[entry.id] = entry
+        bisect.insort(self._order, entry.sort_key)
+        self._names_cache = None
+
+    def _remove(self, patient_id: int) -> None:
+        entry = self._by_id.pop(patient_id, None)
+        if entry is not None:
+            i = bisect.bisect_left(self._order, entry.sort_key)
+            if i < len(self._order) and self._order[i] == entry.sort_key:
+                del self._order[i]
+            self._names_cache = None
+
+    # ---------- lookups ----------
+    def get(self, patient_id: Any) -> Optional[PatientEntry]:
+        self._ensure_loaded()
+        try:
+            return self._by_id.get(int(patient_id))
+        except (TypeError, ValueError):
+            return None
+
+    def label(self, patient_id: Any) -> str:
+        entry = self.get(patient_id)
+        return entry.label if entry else str(patient_id)
+
+    def ids_by_name(self) -> List[int]:
+        self._ensure_loaded()
+        with self._lock:
+            if self._names_cache is None:
+                self._names_cache = [pid for _, pid in self._order]
+            return self._names_cache
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_id)
+
+    def __contains__(self, patient_id: Any) -> bool:
+        return self.get(patient_id) is not None
+
+
+def _advanced_by_one(before: tuple, after: tuple) -> bool:
+    try:
+        return len(before) == len(after) and all(a - b == 1 for a, b in zip(after, before))
+    except TypeError:
+        return False
+
+
+_directory: Optional[PatientDirectory] = None
+_directory_lock = threading.Lock()
+
+
+def get_directory() -> PatientDirectory:
+    """The process-wide directory for the current backend, built on first use."""
+    global _directory
+    with _directory_lock:
+        if _directory is None or _directory.backend is not get_backend():
+            _directory = PatientDirectory()
+        return _directory
@@ -0,0 +1,79 @@
+# patient_timeline.py
+"""
+One patient's chart and report data, loaded in a single backend read.
+
+The patient row, the session series (pain level, first strength grade,
+transcript) and the ROM readings come back from one snapshot and are held
+as pandas columns. Build it once per page or report and hand the same
+object to every plot function and to the PDF builder:
+
+    timeline = PatientTimeline.load(pid)
+    pain_png = plot_pain_trend(timeline)
+    strength_png = plot_strength_progress(timeline)
+    create_patient_pdf(timeline, out_path)
+
+Treat it as read-only: a timeline may be shared through the frame cache.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage_backend import StorageBackend, get_backend
+
+SESSION_COLUMNS = ["id", "created_at", "pain_level", "strength", "transcript"]
+ROM_COLUMNS = ["session_id", "joint", "active", "passive", "start_value", "end_value", "measured_at"]
+
+
+class PatientTimeline:
+    def __init__(self, patient: Dict[str, Any], sessions: List[Dict[str, Any]],
+                 rom: Optional[List[Dict[str, Any]]] = None):
+        self.patient = patient
+        self.patient_id = int(patient["id"])
+        self._session_rows = sessions
+
+        # sessions oldest first; numeric columns as floats so gaps are NaN
+        df = pd.DataFrame(sessions, columns=SESSION_COLUMNS)
+        df["pain_level"] = pd.to_numeric(df["pain_level"], errors="coerce")
+        df["strength"] = pd.to_numeric(df["strength"], errors="coerce")
+        df["session_number"] = np.arange(1, len(df) + 1)
+        self.sessions = df
+
+        rom_df = pd.DataFrame(rom or [], columns=ROM_COLUMNS)
+        for col in ("active", "passive", "start_value", "end_value"):
+            rom_df[col] = pd.to_numeric(rom_df[col], errors="coerce")
+        self.rom = rom_df
+
+    @classmethod
+    def load(cls, patient_id: Any, backend: Optional[StorageBackend] = None,
+             cached: bool = True) -> Optional["PatientTimeline"]:
+        """
+        Read everything for one patient; None if there is no such patient.
+        cached=False bypasses the backend's read cache (one-off bulk reads).
+        """
+        data = (backend or get_backend()).get_patient_timeline(int(patient_id), cached=cached)
+        if data is None:
+            return None
+        return cls(data["patient"], data["sessions"], data["rom"])
+
+    # ---------- series ----------
+    @property
+    def pain(self) -> pd.DataFrame:
+        """Sessions with a recorded pain level (session_number, pain_level, id)."""
+        return self.sessions.loc[self.sessions["pain_level"].notna(), ["id", "session_number", "pain_level"]]
+
+    @property
+    def strength(self) -> pd.DataFrame:
+        """Sessions with a recorded strength grade (session_number, strength, id)."""
+        return self.sessions.loc[self.sessions["strength"].notna(), ["id", "session_number", "strength"]]
+
+    @property
+    def latest_session_id(self) -> Optional[int]:
+        return int(self.sessions["id"].iloc[-1]) if len(self.sessions) else None
+
+    def recent_sessions(self, n: int = 10) -> List[Dict[str, Any]]:
+        """The n newest sessions as stored (created_at, transcript, pain_level ...), newest first."""
+        return self._session_rows[::-1][:n]
+
+    def __len__(self) -> int:
+        return len(self.sessions)
@@ -1,21 +1,218 @@
 from fpdf import FPDF
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Union
 import json
+import os
 from datetime import datetime
-import os # Added os for cleanup
+import io
+import itertools
 
-# Import only the active chart-generation functions
-from data_visualisation import (
-    plot_strength_progress,
-    plot_pain_trend
-)
+from chart_cache import chart_key
+from patient_timeline import PatientTimeline
+from storage_backend import StorageBackend, get_backend
+from pdf_charts import PDF_CHART_VERSION, VECTOR_CHARTS, draw_chart, supports_vector
 
+# Bump whenever the report layout below changes: cached reports built from the
+# old layout are then never served again (see report_cache.py).
+REPORT_TEMPLATE_VERSION = 2
 
-def create_patient_pdf(patient: Dict[str, Any], sessions: List[Dict[str, Any]], out_path: str):
+# "vector": charts drawn with fpdf primitives (pdf_charts.py), no matplotlib.
+# "raster": matplotlib PNGs from data_visualisation, one chart per page.
+CHART_MODES = ("vector", "raster")
+DEFAULT_CHARTS = os.environ.get("PYSIO_PDF_CHARTS", "vector")
+
+
+def _chart_style(charts: str):
+    if charts == "raster":
+        from data_visualisation import CHART_STYLE_VERSION
+        return ("raster", CHART_STYLE_VERSION)
+    return ("vector", PDF_CHART_VERSION)
+
+
+def report_key(timeline: PatientTimeline, charts: str = DEFAULT_CHARTS, full_history: bool = False) -> str:
+    """
+    Cache key of a patient's report: template and chart versions, the patient
+    row and every session and ROM reading the report is drawn from (dates,
+    pain, strength, notes), so an edited or deleted session changes it just
+    as a new one does.
+    """
+    return chart_key("report", REPORT_TEMPLATE_VERSION, _chart_style(charts), bool(full_history),
+                     timeline.patient_id, sorted(timeline.patient.items()),
+                     timeline.sessions.values.tolist(), timeline.rom.values.tolist())
+
+
+# -------------------------------
+# Full session history table
+# -------------------------------
+# (heading, width in mm, history column); the widths add up to the 190 mm
+# between the default margins.
+HISTORY_COLUMNS = [
+    ("Date", 28, "date"),
+    ("Pain", 12, "pain_level"),
+    ("ROM", 36, "rom_summary"),
+    ("Strength", 30, "strength_summary"),
+    ("Notes", 84, "notes"),
+]
+HISTORY_LINE_H = 5
+# rows up to this many lines are moved whole to the next page rather than split
+HISTORY_KEEP_LINES = 10
+
+
+def _pdf_text(value: Any) -> str:
+    # the core fonts are Latin-1 only
+    if value is None:
+        return ""
+    return str(value).replace("→", "->").encode("latin-1", "replace").decode("latin-1")
+
+
+def _history_header(pdf: FPDF) -> None:
+    pdf.set_font("Arial", size=10, style="B")
+    pdf.set_fill_color(230, 230, 230)
+    for heading, width, _ in HISTORY_COLUMNS:
+        pdf.cell(width, 7, heading, border=1, fill=True)
+    pdf.ln(7)
+    pdf.set_font("Arial", size=9)
+
+
+def _cell_lines(pdf: FPDF, width: float, text: str, widths: Dict[str, float]) -> List[str]:
+    """
+    Break text into the lines of a table cell width mm wide, greedily by
+    word, in the current font. fpdf's multi_cell(dry_run=True) does the same
+    but re-measures the line per character and dominated the table build;
+    here a word is measured once per table (widths memoizes it for the
+    table's font), which is exact for the core fonts as they have no kerning.
+    """
+    def measure(word: str) -> float:
+        w = widths.get(word)
+        if w is None:
+            w = widths[word] = pdf.get_string_width(word)
+        return w
+
+    room = width - 2 * pdf.c_margin
+    space = measure(" ")
+    lines = []
+    for paragraph in text.split("\n"):
+        words = [(word, measure(word)) for word in paragraph.split(" ")]
+        if sum(w for _, w in words) + space * (len(words) - 1) <= room:
+            lines.append(paragraph)
+            continue
+        line, line_w = "", 0.0
+        for word, word_w in words:
+            if line and line_w + space + word_w <= room:
+                line, line_w = f"{line} {word}", line_w + space + word_w
+                continue
+            if line:
+                lines.append(line)
+            # a word wider than the cell is cut where it overflows
+            while word_w > room and len(word) > 1:
+                cut = max(1, min(len(word) - 1, int(len(word) * room / word_w)))
+                while cut > 1 and pdf.get_string_width(word[:cut]) > room:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_w = pdf.get_string_width(word)
+            line, line_w = word, word_w
+        lines.append(line)
+    return lines
+
+
+def _add_history_table(pdf: FPDF, rows) -> int:
+    """
+    Lay out session history rows as a bordered table, the header repeated on
+    every page. Rows are drawn as they arrive, so `rows` can be a stream of
+    any length. A long row (big notes) is split across pages. Returns the
+    number of rows drawn.
+    """
+    _history_header(pdf)
+    widths: Dict[str, float] = {}
+    count = 0
+    for row in rows:
+        count += 1
+        cells = [_cell_lines(pdf, width, _pdf_text(row.get(col)), widths) for _, width, col in HISTORY_COLUMNS]
+        while any(cells):
+            needed = max(len(lines) for lines in cells)
+            room = int((pdf.page_break_trigger - pdf.get_y()) // HISTORY_LINE_H)
+            if room < needed and (needed <= HISTORY_KEEP_LINES or room < 3):
+                pdf.add_page()
+                _history_header(pdf)
+                continue
+            take = min(room, needed)
+            x, y = pdf.l_margin, pdf.get_y()
+            for (_, width, _), lines in zip(HISTORY_COLUMNS, cells):
+                pdf.rect(x, y, width, take * HISTORY_LINE_H)
+                for i, line in enumerate(lines[:take]):
+                    pdf.set_xy(x, y + i * HISTORY_LINE_H)
+                    pdf.cell(width, HISTORY_LINE_H, line)
+                x += width
+            cells = [lines[take:] for lines in cells]
+            pdf.set_xy(pdf.l_margin, y + take * HISTORY_LINE_H)
+    return count
+
+
+def _add_vector_charts(pdf: FPDF, timeline: PatientTimeline) -> None:
+    # both charts on one page, drawn from the session series
+    kinds = [kind for kind in VECTOR_CHARTS if not getattr(timeline, VECTOR_CHARTS[kind][0]).empty]
+    if not kinds:
+        return
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "Progress Charts", ln=1)
+    y = pdf.get_y() + 2
+    for kind in kinds:
+        draw_chart(pdf, timeline, kind, x=15, y=y, w=180, h=115)
+        y += 120
+
+
+def _add_raster_charts(pdf: FPDF, timeline: PatientTimeline) -> None:
+    from data_visualisation import plot_pain_trend, plot_strength_progress
+
+    charts = []
+
+    # 1. Pain Trend Plot
+    pain_png = plot_pain_trend(timeline)
+    if pain_png: charts.append(("Pain Trend Over Sessions", pain_png))
+
+    # 2. Strength Progress Plot
+    strength_png = plot_strength_progress(timeline)
+    if strength_png: charts.append(("Strength Progress Over Sessions", strength_png))
+
+    # Insert charts into PDF straight from memory (cached PNG bytes, no files)
+    for title, png in charts:
+        pdf.add_page()
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, title, ln=1)
+        # Use w=180 to fit the chart nicely on an A4 page
+        pdf.image(io.BytesIO(png), x=15, y=None, w=180)
+
+
+def create_patient_pdf(timeline: PatientTimeline, out_path: Optional[str] = None,
+                       charts: str = DEFAULT_CHARTS, full_history: bool = False,
+                       backend: Optional[StorageBackend] = None) -> Union[bytes, str]:
     """
     Creates a comprehensive PDF summary for a patient, including their details,
-    session history, and key progress charts (Pain and Strength).
+    session history, and key progress charts (Pain and Strength). Everything
+    else comes from the one PatientTimeline, so the full history below is
+    the only query made here.
+
+    full_history=True replaces the 10 most recent sessions (notes cut to 80
+    characters) with every session and its complete notes as a paged table.
+    Those rows are streamed from the backend's iter_session_history cursor
+    and drawn as they arrive, so the session rows are never all held in
+    memory at once; the FPDF document itself still grows with every page
+    until it is output.
+
+    Without out_path the whole report is built in memory and returned as
+    bytes, so nothing touches the disk. With out_path it is written there
+    and the path is returned.
+
+    charts="vector" (default, PYSIO_PDF_CHARTS) draws the charts with PDF
+    lines and shapes; charts="raster" embeds matplotlib PNGs instead, which
+    is also the fallback when the installed fpdf cannot draw them.
     """
+    if charts not in CHART_MODES:
+        raise ValueError(f"charts must be one of {CHART_MODES}, not {charts!r}")
+    patient = timeline.patient
+    sessions = timeline.recent_sessions(10)
+
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
@@ -37,10 +234,17 @@ def create_patient_pdf(patient: Dict[str, Any], sessions: List[Dict[str, Any]],
     # Recent Sessions Section
     # -------------------------------
     pdf.set_font("Arial", size=12, style="B")
-    pdf.cell(0, 8, "Recent Sessions:", ln=1)
+    pdf.cell(0, 8, "Full Session History:" if full_history else "Recent Sessions:", ln=1)
     pdf.set_font("Arial", size=11)
 
-    if not sessions:
+    if full_history:
+        history = (backend or get_backend()).iter_session_history(timeline.patient_id)
+        first = next(history, None)
+        if first is None:
+            pdf.cell(0, 6, "No sessions recorded.", ln=1)
+        else:
+            _add_history_table(pdf, itertools.chain([first], history))
+    elif not sessions:
         pdf.cell(0, 6, "No sessions recorded.", ln=1)
     else:
         # Display up to 10 recent sessions
@@ -71,35 +275,78 @@ def create_patient_pdf(patient: Dict[str, Any], sessions: List[Dict[str, Any]],
               ln=1)
 
     # -------------------------------
-    # Generate and Insert Charts
+    # Charts
     # -------------------------------
-    chart_paths = []
-
-    # 1. Pain Trend Plot
-    # FIX: Using 'id' instead of 'patient_id' for the single patient dictionary
-    pain_path = plot_pain_trend(patient["id"]) 
-    if pain_path: chart_paths.append(("Pain Trend Over Sessions", pain_path))
-
-    # 2. Strength Progress Plot
-    # FIX: Using 'id' instead of 'patient_id' for the single patient dictionary
-    strength_path = plot_strength_progress(patient["id"]) 
-    if strength_path: chart_paths.append(("Strength Progress Over Sessions", strength_path))
-
-    
-    # Insert charts into PDF and clean up files
-    for title, img_path in chart_paths:
-        pdf.add_page()
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, title, ln=1)
-        # Use w=180 to fit the chart nicely on an A4 page
-        pdf.image(img_path, x=15, y=None, w=180)
-        
-        # Clean up the generated image file immediately after insertion
-        try:
-            os.remove(img_path)
-        except OSError as e:
-            print(f"Error removing temporary chart file {img_path}: {e}")
+    if charts == "vector" and supports_vector(pdf):
+        _add_vector_charts(pdf, timeline)
+    else:
+        _add_raster_charts(pdf, timeline)
 
     # Final output
+    if out_path is None:
+        return bytes(pdf.output())
     pdf.output(out_path)
     return out_path
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+
+    import datamod_sql
+    from storage_backend import SQLiteBackend
+
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    datamod_sql.DB_FILE = os.path.join(tempfile.mkdtemp(), "full_history.db")
+    datamod_sql.init_db()
+    pid = datamod_sql.add_patient_from_record({"name": "Long Stay", "surgical_procedure": "TKR"})
+    note = "Knee flexion improving, gait re-education continued, home exercises reviewed. " * 6
+    for i in range(0, sessions, 1000):
+        datamod_sql.add_sessions_bulk([
+            {"patient_id": pid, "transcript": f"Session {n + 1}. {note}",
+             "parsed": {"rom": [{"rom_type": "knee_flexion", "start": 20, "end": 40 + n % 80}],
+                        "strength": [{"muscle_group": "quads", "grade": 1 + n % 5}]},
+             "pain_level": 9 - n % 9}
+            for n in range(i, min(i + 1000, sessions))
+        ])
+    backend = SQLiteBackend()
+
+    def timed(fn):
+        # wall time on its own: tracemalloc slows allocation-heavy code ~10x
+        datamod_sql.read_cache.clear()
+        start = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - start
+
+    def peak_kb(fn):
+        # a separate run, for the peak Python allocation only
+        datamod_sql.read_cache.clear()
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 1024
+
+    def stream():
+        return sum(1 for _ in backend.iter_session_history(pid))
+
+    def load_all():
+        return len(backend.get_sessions_for_patient(pid))
+
+    for label, fn in (("stream", stream), ("load all", load_all)):
+        n, elapsed = timed(fn)
+        print(f"{label} {n} sessions: {elapsed * 1000:.0f} ms, peak {peak_kb(fn):.0f} KB")
+
+    timeline = PatientTimeline.load(pid, backend)
+    for full in (False, True):
+        def build():
+            return create_patient_pdf(timeline, full_history=full, backend=backend)
+        pdf, elapsed = timed(build)
+        print(f"{'full history' if full else 'recent only '} report: {elapsed:.2f}s, "
+              f"{len(pdf) / 1024:.0f} KB, peak {peak_kb(build) / 1024:.1f} MB")
@@ -0,0 +1,105 @@
+# query_cache.py
+"""
+Write-aware result cache for read functions.
+
+Each cached function declares the tables it reads. A result is stored with
+the data version of those tables at the time it was read and is served again
+only while that version is unchanged. Versions live in the database itself
+(the data_versions table, bumped by triggers on every write), so a write made
+by any process sharing the DB invalidates every process's cached reads.
+
+    _cache = QueryCache(version_source=get_data_versions, snapshot=read_snapshot)
+
+    @_cache.cached("patients")
+    def get_patient(patient_id): ...
+
+With a snapshot, the version and the data are read inside one read
+transaction, so a stored result is always labelled with the version it was
+actually read at - even if the connection's view lags behind other writers.
+
+Cached results are shared between callers: treat them as read-only.
+"""
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Optional, Sequence
+
+
+class QueryCache:
+    def __init__(self, version_source: Callable[[Sequence[str]], Any], maxsize: int = 512,
+                 scope: Optional[Callable[[], Any]] = None,
+                 snapshot: Optional[Callable[[], ContextManager]] = None):
+        """
+        version_source(tables) returns a value that changes whenever any of the
+        tables is written. scope() (optional) is folded into every key, e.g. the
+        current database file. snapshot() (optional) returns a context manager
+        holding one read transaction; version_source and the cached functions
+        must then read through that same connection.
+        """
+        self.version_source = version_source
+        self.maxsize = maxsize
+        self.scope = scope
+        self.snapshot = snapshot
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, *tables: str) -> Callable:
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = (fn.__qualname__, self.scope() if self.scope else None,
+                       _freeze(args), _freeze(kwargs))
+                # Version and data come from the same snapshot when there is one.
+                # Without one, the version is read first, so a write landing in
+                # between makes the entry look stale - provided both reads see
+                # the latest commit (no transaction pinning an older view).
+                with self.snapshot() if self.snapshot else nullcontext():
+                    version = self.version_source(tables)
+                    with self._lock:
+                        entry = self._entries.get(key)
+                        if entry is not None and entry[0] == version:
+                            self._entries.move_to_end(key)
+                            self.hits += 1
+                            return entry[1]
+                        self.misses += 1
+                    value = fn(*args, **kwargs)
+                with self._lock:
+                    self._entries[key] = (version, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                return value
+
+            wrapper.uncached = fn
+            return wrapper
+        return decorator
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable form of call arguments (dicts/lists as sorted tuples)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return tuple(sorted(_freeze(v) for v in value))
+    return value
@@ -0,0 +1,76 @@
+# record_schema.py
+"""
+Column lists and row shaping shared by the storage backends.
+
+Pure Python with no database access: datamod_sql builds its SQL from these,
+and InMemoryBackend uses them directly, so the in-memory backend never
+imports datamod_sql and never opens or creates pysio.db.
+"""
+import json
+from typing import Any, List, Optional
+
+# Free-text patient columns indexed for search_notes()
+PATIENT_NOTE_COLUMNS = ("additional_notes", "pain_behavior", "wound_condition", "infection_signs")
+
+# Compact default projection for list views; the wide free-text columns are
+# only fetched when a single patient is opened.
+PATIENT_LIST_COLUMNS = ("id", "name", "age", "sex", "surgery_date", "surgical_procedure",
+                        "pain_level", "mobility_status", "next_visit", "created_at")
+
+# Sortable columns -> ORDER BY expression (name uses the NOCASE index)
+PATIENT_SORT_KEYS = {
+    "id": "id",
+    "name": "name COLLATE NOCASE",
+    "age": "age",
+    "surgery_date": "surgery_date",
+    "pain_level": "pain_level",
+    "next_visit": "next_visit",
+    "created_at": "created_at",
+}
+
+WEEKLY_SUMMARY_COLUMNS = ["patient_id", "surgical_procedure", "week", "sessions", "pain_sum", "pain_n",
+                          "rom_sum", "rom_n", "strength_sum", "strength_n"]
+
+
+def loads(text: Optional[str], default: Any) -> Any:
+    """JSON text -> value; default for NULL or unparseable text."""
+    if not isinstance(text, str):
+        return default
+    try:
+        return json.loads(text)
+    except ValueError:
+        return default
+
+
+def rom_rows(entries: Any) -> List[tuple]:
+    """(joint, active, passive, start, end) for every usable ROM entry (form or voice shape)."""
+    rows = []
+    for e in entries or []:
+        if not isinstance(e, dict):
+            continue
+        joint = e.get("joint") or e.get("rom_type")
+        if joint:
+            rows.append((joint, e.get("active"), e.get("passive"), e.get("start"), e.get("end")))
+    return rows
+
+
+def strength_rows(entries: Any) -> List[tuple]:
+    """(muscle_group, grade) for every usable strength entry."""
+    rows = []
+    for e in entries or []:
+        if not isinstance(e, dict):
+            continue
+        group = e.get("muscle_group") or e.get("muscle")
+        if group is not None and e.get("grade") is not None:
+            rows.append((group, e.get("grade")))
+    return rows
+
+
+def session_measurements(parsed: Any) -> tuple:
+    """(rom rows, strength rows) of a session's parsed data."""
+    # voice sessions store "rom"/"strength", form sessions "rom_entries"/"strength_entries"
+    if not isinstance(parsed, dict):
+        return [], []
+    rom = rom_rows(parsed.get("rom") or parsed.get("rom_entries"))
+    strength = strength_rows(parsed.get("strength") or parsed.get("strength_entries"))
+    return rom, strength
@@ -0,0 +1,171 @@
+# render_service.py
+"""
+Parallel chart rendering on a process pool.
+
+The parent process loads PatientTimelines and checks the chart cache; only
+charts that are not cached are sent to worker processes, as plain
+(kind, patient, x, y, options) jobs - workers never touch the database.
+Finished PNGs go back into the parent's chart cache.
+
+    service = get_render_service()
+    charts = service.chart_set(timeline)                # {"pain_trend": b"...", ...}
+    by_patient = service.render_patients([3, 7, 11])    # {3: {...}, 7: {...}, ...}
+
+    python render_service.py [patients] [sessions]      # speedup benchmark
+
+Workers are started with "spawn": forking a process that has live
+Streamlit threads and SQLite connections is not safe.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional
+
+from chart_cache import ChartCache, get_chart_cache
+from data_visualisation import CHARTS, as_timeline, chart_job, render_chart
+from patient_timeline import PatientTimeline
+
+CHART_KINDS = tuple(CHARTS)
+
+
+def _warm(delay: float) -> int:
+    # importing data_visualisation in the worker pays the matplotlib import up front
+    import data_visualisation  # noqa: F401
+    time.sleep(delay)
+    return os.getpid()
+
+
+class RenderService:
+    def __init__(self, workers: Optional[int] = None, cache: Optional[ChartCache] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache or get_chart_cache()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def warm(self) -> None:
+        """Start every worker now instead of on the first render."""
+        pool = self._executor()
+        list(pool.map(_warm, [0.05] * self.workers))
+
+    def render(self, timelines: Iterable[PatientTimeline], kinds: Iterable[str] = CHART_KINDS,
+               figsize=(8, 4), dpi: int = 100) -> Dict[int, Dict[str, Optional[bytes]]]:
+        """
+        PNG bytes for every chart kind of every timeline ({patient_id: {kind:
+        bytes or None}}, in input order). Cached charts are returned as-is;
+        the rest are rendered in parallel.
+        """
+        kinds = list(kinds)
+        out: Dict[int, Dict[str, Optional[bytes]]] = {}
+        pending: Dict[Any, tuple] = {}
+        for timeline in timelines:
+            charts = out[timeline.patient_id] = {}
+            for kind in kinds:
+                job = chart_job(timeline, kind, figsize, dpi)
+                charts[kind] = None
+                if job is None:
+                    continue
+                key, args = job
+                charts[kind] = self.cache.get(key)
+                if charts[kind] is None:
+                    pending[self._executor().submit(render_chart, *args)] = (timeline.patient_id, kind, key)
+
+        for fut in as_completed(pending):
+            patient_id, kind, key = pending[fut]
+            png = fut.result()
+            self.cache.put(key, png)
+            out[patient_id][kind] = png
+        return out
+
+    def chart_set(self, patient: Any, kinds: Iterable[str] = CHART_KINDS, **options) -> Dict[str, Optional[bytes]]:
+        """All charts for one patient (PatientTimeline or id); {} if the patient doesn't exist."""
+        timeline = as_timeline(patient)
+        if timeline is None:
+            return {}
+        return self.render([timeline], kinds, **options)[timeline.patient_id]
+
+    def render_patients(self, patient_ids: Iterable[Any], kinds: Iterable[str] = CHART_KINDS,
+                        **options) -> Dict[int, Dict[str, Optional[bytes]]]:
+        """Charts for many patients; unknown ids are skipped."""
+        timelines: List[PatientTimeline] = []
+        for pid in patient_ids:
+            timeline = PatientTimeline.load(pid)
+            if timeline is not None:
+                timelines.append(timeline)
+        return self.render(timelines, kinds, **options)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+_service: Optional[RenderService] = None
+_service_lock = threading.Lock()
+
+
+def get_render_service() -> RenderService:
+    """The process-wide render service; workers start on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RenderService()
+            atexit.register(_service.close)
+        return _service
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def _synthetic_timelines(patients: int, sessions: int) -> List[PatientTimeline]:
+    timelines = []
+    for pid in range(1, patients + 1):
+        rows = [{"id": pid * 10000 + n, "created_at": f"2024-01-01 00:00:{n % 60:02d}",
+                 "pain_level": (pid + n) % 11, "strength": (pid + n) % 6, "transcript": ""}
+                for n in range(sessions)]
+        timelines.append(PatientTimeline({"id": pid}, rows))
+    return timelines
+
+
+if __name__ == "__main__":
+    import sys
+
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    timelines = _synthetic_timelines(patients, sessions)
+    charts = patients * len(CHART_KINDS)
+
+    start = time.perf_counter()
+    for t in timelines:
+        for kind in CHART_KINDS:
+            render_chart(*chart_job(t, kind)[1])
+    serial = time.perf_counter() - start
+    print(f"{charts} charts ({sessions} sessions each), in-process serial: {serial:.2f}s")
+
+    cpus = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+    for workers in counts:
+        service = RenderService(workers=workers, cache=ChartCache())
+        service.warm()
+        start = time.perf_counter()
+        service.render(timelines)
+        elapsed = time.perf_counter() - start
+        service.close()
+        print(f"RenderService(workers={workers}): {elapsed:.2f}s  speedup x{serial / elapsed:.2f}")
+
+    service = RenderService(workers=1, cache=ChartCache())
+    service.render(timelines[:1])
+    start = time.perf_counter()
+    service.render(timelines[:1])
+    print(f"repeat of a cached chart set: {(time.perf_counter() - start) * 1000:.2f} ms")
+    service.close()
@@ -0,0 +1,41 @@
+# report_cache.py
+"""
+Cache of generated PDF reports.
+
+A report's key (pdf_export.report_key) covers the template version, the
+chart style, the patient's row and their sessions and ROM readings, so a
+repeat export of an unchanged patient is served from here and only
+patients with new or edited data are laid out again - one at a time or in
+a batch.
+
+Same two tiers as the chart cache (chart_cache.ChartCache): an LRU bounded
+by total bytes, plus an optional shared disk tier (PYSIO_REPORT_CACHE_DIR).
+Entries also expire after REPORT_MAX_AGE seconds, since each report carries
+the date it was generated.
+"""
+import os
+import threading
+from typing import Optional
+
+from chart_cache import ChartCache
+
+REPORT_CACHE_BYTES = 64 * 1024 * 1024
+REPORT_MAX_AGE = 24 * 60 * 60
+
+
+class ReportCache(ChartCache):
+    suffix = ".pdf"
+
+
+_reports: Optional[ReportCache] = None
+_reports_lock = threading.Lock()
+
+
+def get_report_cache() -> ReportCache:
+    """Process-wide report cache; disk tier enabled by PYSIO_REPORT_CACHE_DIR."""
+    global _reports
+    with _reports_lock:
+        if _reports is None:
+            _reports = ReportCache(max_bytes=REPORT_CACHE_BYTES, max_age=REPORT_MAX_AGE,
+                                   disk_dir=os.environ.get("PYSIO_REPORT_CACHE_DIR") or None)
+        return _reports
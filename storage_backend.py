@@ -0,0 +1,527 @@
+# storage_backend.py
+"""
+Storage backend protocol used by compat_shim, ui_voice, the charts and the
+PDF export, so the UI never talks to a particular database directly.
+
+Two implementations ship here:
+  - SQLiteBackend   -> datamod_sql (the default, pysio.db)
+  - InMemoryBackend -> plain dicts, for demos, tests and benchmarking
+
+Pick one with the PYSIO_STORAGE environment variable ("sqlite" / "memory")
+or set_backend(). storage_conformance.py runs the same checks and benchmark
+against every backend.
+"""
+import json
+import math
+import os
+import threading
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional, Protocol, Sequence, runtime_checkable
+
+from record_schema import (
+    PATIENT_LIST_COLUMNS,
+    PATIENT_NOTE_COLUMNS,
+    PATIENT_SORT_KEYS,
+    WEEKLY_SUMMARY_COLUMNS,
+    rom_rows,
+    session_measurements,
+    strength_rows,
+)
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    name: str
+
+    # patients
+    def add_patient(self, record: Dict[str, Any]) -> int: ...
+    def get_patient(self, patient_id: int) -> Optional[Dict[str, Any]]: ...
+    def get_all_patients(self) -> List[Dict[str, Any]]: ...
+    def list_patients(self, columns: Optional[List[str]] = None, after_id: Optional[int] = None,
+                      limit: Optional[int] = 50, filters: Optional[Dict[str, Any]] = None,
+                      order_by: str = "id", descending: bool = True,
+                      after_value: Any = None) -> List[Dict[str, Any]]: ...
+    def count_patients(self, filters: Optional[Dict[str, Any]] = None) -> int: ...
+    def update_patient_fields(self, patient_id: int, updates: Dict[str, Any]) -> bool: ...
+
+    # sessions
+    def add_session(self, patient_id: int, transcript: str, parsed: Dict[str, Any],
+                    pain_level: Optional[int] = None) -> int: ...
+    def apply_session_updates(self, patient_id: int, transcript: str, parsed: Dict[str, Any],
+                              updates: Dict[str, Any], pain_level: Optional[int] = None) -> int: ...
+    def get_sessions_for_patient(self, patient_id: int) -> List[Dict[str, Any]]: ...
+    def get_session_series(self, patient_id: int) -> List[Dict[str, Any]]: ...
+    def get_session_history(self, patient_id: int, notes_chars: int = 120) -> List[Dict[str, Any]]: ...
+    def iter_session_history(self, patient_id: int, batch: int = 500) -> Iterator[Dict[str, Any]]: ...
+    def get_patient_ids_seen(self, since: Optional[str] = None, until: Optional[str] = None) -> List[int]: ...
+    def get_patient_timeline(self, patient_id: int, cached: bool = True) -> Optional[Dict[str, Any]]: ...
+
+    # cohort analytics: per-patient, per-week totals as columns
+    def get_weekly_summary(self) -> Dict[str, List[Any]]: ...
+
+    # notes
+    def search_notes(self, query: str, patient_id: Optional[int] = None, limit: int = 50,
+                     since: Optional[str] = None) -> List[Dict[str, Any]]: ...
+
+    # cache invalidation: changes whenever any of the tables is written
+    def data_version(self, tables: Sequence[str]) -> tuple: ...
+
+    # keep connections in `state` (a mapping that outlives the thread, e.g.
+    # st.session_state) and use them on the calling thread
+    def bind_connections(self, state: MutableMapping[str, Any]) -> None: ...
+
+
+# ---------- SQLite ----------
+class SQLiteBackend:
+    """
+    Delegates to datamod_sql (one WAL connection per thread). Writes commit
+    directly on the calling thread by default. With write_queue=True (or
+    PYSIO_WRITE_QUEUE=1) they go through the single-writer queue instead and
+    concurrent saves are group-committed; see writer_service.py for when
+    that pays off.
+    """
+    name = "SQLite"
+
+    def __init__(self, write_queue: Optional[bool] = None):
+        import datamod_sql
+        self._db = datamod_sql
+        self._db.init_db()  # create / migrate DB_FILE at startup, not on the first request
+        if write_queue is None:
+            write_queue = os.environ.get("PYSIO_WRITE_QUEUE", "").lower() in ("1", "true", "yes")
+        self._writer = None
+        if write_queue:
+            from writer_service import get_writer
+            self._writer = get_writer()
+
+    def _write(self, fn, *args):
+        if self._writer is None:
+            return fn(*args)
+        return self._writer.submit(fn, *args).result()
+
+    @property
+    def location(self) -> str:
+        return os.path.abspath(self._db.DB_FILE)
+
+    def add_patient(self, record):
+        return self._write(self._db.add_patient_from_record, record)
+
+    def get_patient(self, patient_id):
+        return self._db.get_patient(patient_id)
+
+    def get_all_patients(self):
+        return self._db.get_all_patients()
+
+    def list_patients(self, **kwargs):
+        return self._db.list_patients(**kwargs)
+
+    def count_patients(self, filters=None):
+        return self._db.count_patients(filters)
+
+    def update_patient_fields(self, patient_id, updates):
+        return self._write(self._db.update_patient_fields, patient_id, updates)
+
+    def add_session(self, patient_id, transcript, parsed, pain_level=None):
+        return self._write(self._db.add_session, patient_id, transcript, parsed, pain_level)
+
+    def apply_session_updates(self, patient_id, transcript, parsed, updates, pain_level=None):
+        return self._write(self._db.apply_session_updates, patient_id, transcript, parsed, updates, pain_level)
+
+    def get_sessions_for_patient(self, patient_id):
+        return self._db.get_sessions_for_patient(patient_id)
+
+    def get_session_series(self, patient_id):
+        return self._db.get_session_series(patient_id)
+
+    def get_session_history(self, patient_id, notes_chars=120):
+        return self._db.get_session_history(patient_id, notes_chars)
+
+    def iter_session_history(self, patient_id, batch=500):
+        return self._db.iter_session_history(patient_id, batch)
+
+    def get_patient_ids_seen(self, since=None, until=None):
+        return self._db.get_patient_ids_seen(since, until)
+
+    def get_patient_timeline(self, patient_id, cached=True):
+        # cached=False skips read_cache: one-off bulk reads (batch export)
+        # would otherwise keep every timeline they touch
+        read = self._db.get_patient_timeline
+        return (read if cached else read.uncached)(patient_id)
+
+    def get_weekly_summary(self):
+        return self._db.get_weekly_summary()
+
+    def search_notes(self, query, patient_id=None, limit=50, since=None):
+        return self._db.search_notes(query, patient_id=patient_id, limit=limit, since=since)
+
+    def data_version(self, tables):
+        return self._db.get_data_versions(tables)
+
+    def bind_connections(self, state):
+        connections = state.get("_pysio_db_connections")
+        if connections is None:
+            connections = state["_pysio_db_connections"] = self._db.ConnectionSet()
+        self._db.use_connections(connections)
+
+
+# ---------- In-memory ----------
+def _now() -> str:
+    # same format as SQLite's CURRENT_TIMESTAMP (UTC)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _num(value: Any) -> str:
+    # matches printf('%g') in datamod_sql.get_session_history
+    return "?" if value is None else f"{value:g}"
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def _week_origin(patient: Dict[str, Any]) -> Optional[datetime]:
+    # surgery date, else record creation (as in datamod_sql._week_sql)
+    return _parse_ts(patient.get("surgery_date")) or _parse_ts(patient.get("created_at"))
+
+
+def _weeks_since(origin: Optional[datetime], ts: Any) -> int:
+    when = _parse_ts(ts)
+    if origin is None or when is None:
+        return 0
+    return math.floor((when - origin).total_seconds() / 86400 / 7)
+
+
+def _sort_key(value: Any, nocase: bool) -> tuple:
+    # SQLite orders NULLs before everything else
+    if value is None:
+        return (0, "")
+    return (1, value.lower() if nocase and isinstance(value, str) else value)
+
+
+class InMemoryBackend:
+    """
+    Dict-backed store with the same semantics as SQLiteBackend (JSON-encoded
+    rom/strength entries, NULL-first ordering, keyset pages). Nothing persists.
+    """
+    name = "In-memory"
+    location = ":memory:"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._patients: Dict[int, Dict[str, Any]] = {}
+        self._sessions: Dict[int, Dict[str, Any]] = {}
+        self._next_patient = 1
+        self._next_session = 1
+        self._versions: Counter = Counter()
+
+    def data_version(self, tables):
+        with self._lock:
+            return tuple(self._versions[t] for t in tables)
+
+    def bind_connections(self, state):
+        pass  # no connections to keep
+
+    # patients
+    def add_patient(self, record):
+        row = {k: v for k, v in record.items() if k not in ("id", "created_at")}
+        for col in ("rom_entries", "strength_entries"):
+            row[col] = json.dumps(record.get(col) or [])
+        with self._lock:
+            pid = self._next_patient
+            self._next_patient += 1
+            row["id"] = pid
+            row["created_at"] = _now()
+            self._patients[pid] = row
+            self._versions["patients"] += 1
+        return pid
+
+    def get_patient(self, patient_id):
+        with self._lock:
+            row = self._patients.get(int(patient_id))
+            return dict(row) if row else None
+
+    def get_all_patients(self):
+        with self._lock:
+            return [dict(self._patients[pid]) for pid in sorted(self._patients, reverse=True)]
+
+    def _filtered(self, filters):
+        rows = list(self._patients.values())
+        for col, value in (filters or {}).items():
+            if value is None or value == "":
+                continue
+            if isinstance(value, str):
+                needle = value.lower()
+                rows = [r for r in rows if needle in str(r.get(col) or "").lower()]
+            elif isinstance(value, tuple):
+                lo, hi = value
+                rows = [r for r in rows if r.get(col) is not None
+                        and (lo is None or r[col] >= lo) and (hi is None or r[col] <= hi)]
+            else:
+                rows = [r for r in rows if r.get(col) == value]
+        return rows
+
+    def list_patients(self, columns=None, after_id=None, limit=50, filters=None,
+                      order_by="id", descending=True, after_value=None):
+        if order_by not in PATIENT_SORT_KEYS:
+            raise ValueError(f"Cannot sort patients by: {order_by}")
+        nocase = order_by == "name"
+
+        def key(value, pid):
+            return (_sort_key(value, nocase), pid)
+
+        with self._lock:
+            rows = sorted(self._filtered(filters), key=lambda r: key(r.get(order_by), r["id"]),
+                          reverse=descending)
+            if after_id is not None:
+                cursor = key(after_id if order_by == "id" else after_value, after_id)
+                if descending:
+                    rows = [r for r in rows if key(r.get(order_by), r["id"]) < cursor]
+                else:
+                    rows = [r for r in rows if key(r.get(order_by), r["id"]) > cursor]
+            if limit is not None:
+                rows = rows[:int(limit)]
+            cols = list(columns or PATIENT_LIST_COLUMNS)
+            for col in ("id", order_by):
+                if col not in cols:
+                    cols.append(col)
+            return [{c: r.get(c) for c in cols} for r in rows]
+
+    def count_patients(self, filters=None):
+        with self._lock:
+            return len(self._filtered(filters))
+
+    def update_patient_fields(self, patient_id, updates):
+        if not updates:
+            return False
+        with self._lock:
+            row = self._patients.get(int(patient_id))
+            if row is None:
+                return False
+            for k, v in updates.items():
+                row[k] = json.dumps(v) if k in ("rom_entries", "strength_entries") else v
+            self._versions["patients"] += 1
+            return True
+
+    # sessions
+    def add_session(self, patient_id, transcript, parsed, pain_level=None):
+        with self._lock:
+            sid = self._next_session
+            self._next_session += 1
+            self._sessions[sid] = {
+                "id": sid,
+                "patient_id": int(patient_id),
+                "transcript": transcript,
+                "parsed_json": json.dumps(parsed),
+                "pain_level": pain_level,
+                "created_at": _now(),
+            }
+            self._versions.update(("sessions", "rom_measurements", "strength_measurements"))
+        return sid
+
+    def apply_session_updates(self, patient_id, transcript, parsed, updates, pain_level=None):
+        with self._lock:
+            if int(patient_id) not in self._patients:
+                raise LookupError(f"No patient with id {patient_id}")
+            self.update_patient_fields(patient_id, updates)
+            return self.add_session(patient_id, transcript, parsed, pain_level)
+
+    def _patient_sessions(self, patient_id):
+        pid = int(patient_id)
+        return sorted((s for s in self._sessions.values() if s["patient_id"] == pid),
+                      key=lambda s: (s["created_at"], s["id"]))
+
+    def get_sessions_for_patient(self, patient_id):
+        with self._lock:
+            return [dict(s) for s in reversed(self._patient_sessions(patient_id))]
+
+    def get_session_series(self, patient_id):
+        with self._lock:
+            sessions = self._patient_sessions(patient_id)
+        series = []
+        for s in sessions:
+            _, strength = session_measurements(json.loads(s["parsed_json"]))
+            series.append({
+                "id": s["id"],
+                "created_at": s["created_at"],
+                "pain_level": s["pain_level"],
+                "strength": strength[0][1] if strength else None,
+            })
+        return series
+
+    @staticmethod
+    def _history_row(s, notes):
+        rom, strength = session_measurements(json.loads(s["parsed_json"]))
+        rom_summary = strength_summary = None
+        if rom:
+            joint, active, passive, start, end = rom[0]
+            if start is not None or end is not None:
+                rom_summary = f"{joint}: {_num(start)}→{_num(end)}°"
+            else:
+                rom_summary = f"{joint}: A {_num(active)} / P {_num(passive)}"
+        if strength:
+            strength_summary = f"{strength[0][0]} ({_num(strength[0][1])})"
+        return {
+            "id": s["id"],
+            "date": s["created_at"][:16],
+            "pain_level": s["pain_level"],
+            "rom_summary": rom_summary,
+            "strength_summary": strength_summary,
+            "notes": notes,
+        }
+
+    def get_session_history(self, patient_id, notes_chars=120):
+        with self._lock:
+            sessions = list(reversed(self._patient_sessions(patient_id)))
+        history = []
+        for s in sessions:
+            notes = s["transcript"]
+            if notes is not None and len(notes) > notes_chars:
+                notes = notes[:notes_chars - 3] + "..."
+            history.append(self._history_row(s, notes))
+        return history
+
+    def iter_session_history(self, patient_id, batch=500):
+        with self._lock:
+            sessions = self._patient_sessions(patient_id)
+        for s in sessions:
+            yield self._history_row(s, s["transcript"])
+
+    def get_patient_ids_seen(self, since=None, until=None):
+        with self._lock:
+            return sorted({s["patient_id"] for s in self._sessions.values()
+                           if (not since or s["created_at"] >= since) and (not until or s["created_at"] < until)
+                           and s["patient_id"] in self._patients})
+
+    def get_patient_timeline(self, patient_id, cached=True):
+        with self._lock:
+            patient = self.get_patient(patient_id)
+            if patient is None:
+                return None
+            sessions = self._patient_sessions(patient_id)
+
+        def rom_dicts(entries, session_id, measured_at):
+            return [{"session_id": session_id, "joint": joint, "active": active, "passive": passive,
+                     "start_value": start, "end_value": end, "measured_at": measured_at}
+                    for joint, active, passive, start, end in entries]
+
+        # like SQLite: the patient's own ROM entries are readings without a session
+        rom = rom_dicts(rom_rows(json.loads(patient["rom_entries"])), None, patient["created_at"])
+        series = []
+        for s in sessions:
+            session_rom, strength = session_measurements(json.loads(s["parsed_json"]))
+            rom.extend(rom_dicts(session_rom, s["id"], s["created_at"]))
+            series.append({
+                "id": s["id"],
+                "created_at": s["created_at"],
+                "pain_level": s["pain_level"],
+                "transcript": s["transcript"],
+                "strength": strength[0][1] if strength else None,
+            })
+        rom.sort(key=lambda r: r["measured_at"])
+        return {"patient": patient, "sessions": series, "rom": rom}
+
+    def get_weekly_summary(self):
+        # computed on demand: same buckets as SQLite's patient_week_summary
+        buckets: Dict[tuple, Counter] = {}
+
+        def add(patient, ts, **values):
+            week = _weeks_since(_week_origin(patient), ts)
+            buckets.setdefault((patient["id"], week), Counter()).update(values)
+
+        def add_readings(patient, ts, rom, strength):
+            for _, active, _, _, end in rom:
+                value = end if end is not None else active
+                if value is not None:
+                    add(patient, ts, rom_sum=value, rom_n=1)
+            for _, grade in strength:
+                add(patient, ts, strength_sum=grade, strength_n=1)
+
+        with self._lock:
+            patients = {pid: dict(p) for pid, p in self._patients.items()}
+            sessions = list(self._sessions.values())
+        for p in patients.values():
+            add_readings(p, p["created_at"], rom_rows(json.loads(p["rom_entries"])),
+                         strength_rows(json.loads(p["strength_entries"])))
+        for s in sessions:
+            p = patients.get(s["patient_id"])
+            if p is None:
+                continue  # orphan session: SQLite's join drops it too
+            pain = s["pain_level"]
+            add(p, s["created_at"], sessions=1, pain_sum=pain or 0, pain_n=int(pain is not None))
+            rom, strength = session_measurements(json.loads(s["parsed_json"]))
+            add_readings(p, s["created_at"], rom, strength)
+
+        columns: Dict[str, List[Any]] = {name: [] for name in WEEKLY_SUMMARY_COLUMNS}
+        for (pid, week), totals in sorted(buckets.items()):
+            row = {"patient_id": pid, "surgical_procedure": patients[pid].get("surgical_procedure"), "week": week}
+            for name in WEEKLY_SUMMARY_COLUMNS:
+                columns[name].append(row[name] if name in row else totals[name])
+        return columns
+
+    # notes
+    def search_notes(self, query, patient_id=None, limit=50, since=None):
+        terms = [t.lower() for t in query.split() if t.strip()]
+        if not terms:
+            return []
+
+        def matches(text):
+            text = (text or "").lower()
+            return all(t.rstrip("*") in text for t in terms)
+
+        hits = []
+        with self._lock:
+            for s in self._sessions.values():
+                if patient_id is not None and s["patient_id"] != int(patient_id):
+                    continue
+                if since and s["created_at"] < since:
+                    continue
+                if matches(s["transcript"]):
+                    p = self._patients.get(s["patient_id"]) or {}
+                    hits.append({"source": "session", "source_id": s["id"], "patient_id": s["patient_id"],
+                                 "name": p.get("name"), "created_at": s["created_at"],
+                                 "snippet": s["transcript"]})
+            for p in self._patients.values():
+                if patient_id is not None and p["id"] != int(patient_id):
+                    continue
+                if since and p["created_at"] < since:
+                    continue
+                for col in PATIENT_NOTE_COLUMNS:
+                    if matches(p.get(col)):
+                        hits.append({"source": "patient", "source_id": p["id"], "patient_id": p["id"],
+                                     "name": p.get("name"), "created_at": p["created_at"],
+                                     "snippet": p[col]})
+                        break
+        return hits[:int(limit)]
+
+
+# ---------- Selection ----------
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "memory": InMemoryBackend,
+}
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    """The process-wide backend, created on first use from PYSIO_STORAGE (default sqlite)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            kind = os.environ.get("PYSIO_STORAGE", "sqlite").lower()
+            if kind not in BACKENDS:
+                raise ValueError(f"Unknown PYSIO_STORAGE backend: {kind}")
+            _backend = BACKENDS[kind]()
+        return _backend
+
+
+def set_backend(backend: StorageBackend) -> None:
+    global _backend
+    with _backend_lock:
+        _backend = backend
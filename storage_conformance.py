@@ -0,0 +1,195 @@
+# storage_conformance.py
+"""
+Shared conformance checks and micro-benchmark for every StorageBackend.
+
+    python storage_conformance.py                 # all backends, 2000 patients
+    python storage_conformance.py memory 10000    # one backend, custom size
+
+SQLite runs against a throwaway file, never pysio.db. A new backend only has
+to be added to storage_backend.BACKENDS to be covered here.
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import datamod_sql
+from storage_backend import BACKENDS, StorageBackend
+
+
+def fresh_backend(kind: str) -> StorageBackend:
+    if kind == "sqlite":
+        datamod_sql.DB_FILE = os.path.join(tempfile.mkdtemp(), "conformance.db")
+        datamod_sql.init_db()
+    return BACKENDS[kind]()
+
+
+# ---------- Conformance ----------
+def check_conformance(backend: StorageBackend) -> None:
+    """Raises AssertionError on the first behaviour that differs from the contract."""
+    assert isinstance(backend, StorageBackend)
+
+    ann = backend.add_patient({"name": "ann", "age": 40, "surgical_procedure": "TKR",
+                               "wound_condition": "some pus near incision",
+                               "rom_entries": [{"joint": "knee", "active": 90, "passive": 100}],
+                               "strength_entries": [{"muscle_group": "quads", "grade": 3}]})
+    bob = backend.add_patient({"name": "Bob", "age": None, "surgical_procedure": "ACL repair"})
+    cat = backend.add_patient({"name": "cat", "age": 30, "surgical_procedure": "tkr revision"})
+    assert ann < bob < cat
+
+    p = backend.get_patient(ann)
+    assert p["id"] == ann and p["name"] == "ann" and p["created_at"]
+    assert isinstance(p["rom_entries"], str)  # stored JSON-encoded, as the UI expects
+    assert backend.get_patient(999999) is None
+    assert [r["id"] for r in backend.get_all_patients()] == [cat, bob, ann]
+
+    # listing: projection, ordering, filters, keyset pages
+    page = backend.list_patients(columns=["name"], limit=2)
+    assert [r["id"] for r in page] == [cat, bob] and set(page[0]) == {"name", "id"}
+    assert [r["id"] for r in backend.list_patients(after_id=bob, limit=5)] == [ann]
+    by_name = backend.list_patients(order_by="name", descending=False, limit=None)
+    assert [r["name"] for r in by_name] == ["ann", "Bob", "cat"]
+    by_age = backend.list_patients(order_by="age", descending=False, limit=None)
+    assert [r["id"] for r in by_age] == [bob, cat, ann]  # NULL first
+    nxt = backend.list_patients(order_by="age", descending=False, after_id=bob, after_value=None, limit=5)
+    assert [r["id"] for r in nxt] == [cat, ann]
+    assert backend.count_patients({"surgical_procedure": "tkr"}) == 2
+    assert backend.count_patients({"age": (35, None)}) == 1
+    assert backend.count_patients() == 3
+
+    assert backend.update_patient_fields(bob, {"age": 55}) is True
+    assert backend.get_patient(bob)["age"] == 55
+    assert backend.update_patient_fields(bob, {}) is False
+    assert backend.update_patient_fields(999999, {"age": 1}) is False
+
+    # sessions
+    s1 = backend.add_session(ann, "knee flexion 30 degrees, pain 6", {"strength": [{"muscle_group": "quads", "grade": 3}]}, 6)
+    s2 = backend.add_session(ann, "walking better", {"strength_entries": [{"muscle_group": "quads", "grade": 4}]}, 4)
+    s3 = backend.add_session(ann, "", {}, None)
+    sessions = backend.get_sessions_for_patient(ann)
+    assert [s["id"] for s in sessions] == [s3, s2, s1]  # newest first
+    assert backend.get_sessions_for_patient(cat) == []
+
+    s4 = backend.apply_session_updates(cat, "pain 2, quads 5", {"strength": [{"muscle_group": "quads", "grade": 5}]},
+                                       {"pain_level": 2}, 2)
+    assert backend.get_patient(cat)["pain_level"] == 2
+    assert [s["strength"] for s in backend.get_session_series(cat)] == [5]
+    try:
+        backend.apply_session_updates(999999, "", {}, {"pain_level": 1})
+        raise AssertionError("apply_session_updates accepted an unknown patient")
+    except LookupError:
+        pass
+    assert [s["id"] for s in backend.get_sessions_for_patient(cat)] == [s4]
+
+    history = backend.get_session_history(ann, notes_chars=12)
+    assert [h["id"] for h in history] == [s3, s2, s1]
+    assert history[2]["strength_summary"] == "quads (3)" and history[2]["notes"] == "knee flex..."
+    assert history[0]["rom_summary"] is None and len(history[0]["date"]) == 16
+    s5 = backend.add_session(bob, "rom", {"rom": [{"rom_type": "knee_flexion", "start": 30, "end": 45.5}]}, None)
+    assert backend.get_session_history(bob)[0]["rom_summary"] == "knee_flexion: 30→45.5°"
+    assert backend.get_session_history(bob)[0]["id"] == s5
+
+    full = list(backend.iter_session_history(ann, batch=2))  # oldest first, notes not cut
+    assert [h["id"] for h in full] == [s1, s2, s3]
+    assert full[0]["notes"] == "knee flexion 30 degrees, pain 6"
+    assert [h["strength_summary"] for h in full] == [h["strength_summary"] for h in reversed(history)]
+    assert list(backend.iter_session_history(999999)) == []
+
+    assert backend.get_patient_ids_seen() == [ann, bob, cat]
+    assert backend.get_patient_ids_seen(since="2000-01-01", until="2000-01-02") == []
+    assert backend.get_patient_ids_seen(until="9999-01-01") == [ann, bob, cat]
+
+    series = backend.get_session_series(ann)
+    assert [s["id"] for s in series] == [s1, s2, s3]  # oldest first
+    assert [s["pain_level"] for s in series] == [6, 4, None]
+    assert [s["strength"] for s in series] == [3, 4, None]
+
+    timeline = backend.get_patient_timeline(ann)
+    assert timeline["patient"]["id"] == ann
+    assert [s["id"] for s in timeline["sessions"]] == [s1, s2, s3]
+    assert [s["strength"] for s in timeline["sessions"]] == [3, 4, None]
+    assert timeline["sessions"][0]["transcript"] == "knee flexion 30 degrees, pain 6"
+    assert [(r["session_id"], r["joint"], r["active"]) for r in timeline["rom"]] == [(None, "knee", 90)]
+    assert [(r["session_id"], r["start_value"], r["end_value"])
+            for r in backend.get_patient_timeline(bob)["rom"]] == [(s5, 30, 45.5)]
+    assert backend.get_patient_timeline(999999) is None
+    assert backend.get_patient_timeline(ann, cached=False) == timeline
+    assert backend.get_patient_timeline(999999, cached=False) is None
+
+    # cohort summary: weeks since surgery (or since the record was created)
+    dee = backend.add_patient({"name": "dee", "surgical_procedure": "TKR", "surgery_date": "2000-01-01"})
+    backend.add_session(dee, "", {"strength": [{"muscle_group": "quads", "grade": 2}]}, 7)
+    backend.add_session(dee, "", {"rom": [{"rom_type": "knee_flexion", "start": 10, "end": 40}]}, 5)
+    summary = backend.get_weekly_summary()
+    assert set(summary) >= {"patient_id", "week", "sessions", "pain_sum", "pain_n", "rom_sum", "rom_n",
+                            "strength_sum", "strength_n", "surgical_procedure"}
+    rows = [dict(zip(summary, values)) for values in zip(*summary.values())]
+    dee_rows = [r for r in rows if r["patient_id"] == dee]
+    assert len(dee_rows) == 1 and dee_rows[0]["week"] > 1000 and dee_rows[0]["surgical_procedure"] == "TKR"
+    assert (dee_rows[0]["sessions"], dee_rows[0]["pain_sum"], dee_rows[0]["pain_n"]) == (2, 12, 2)
+    assert (dee_rows[0]["rom_sum"], dee_rows[0]["rom_n"], dee_rows[0]["strength_n"]) == (40, 1, 1)
+    ann_rows = [r for r in rows if r["patient_id"] == ann]
+    assert [r["week"] for r in ann_rows] == [0]  # no surgery date: counted from creation
+    assert (ann_rows[0]["sessions"], ann_rows[0]["pain_n"], ann_rows[0]["rom_sum"]) == (3, 2, 90)
+    assert ann_rows[0]["strength_sum"] == 3 + 3 + 4  # intake entry + two sessions
+    backend.update_patient_fields(dee, {"surgery_date": None})
+    moved = backend.get_weekly_summary()
+    assert [w for pid, w in zip(moved["patient_id"], moved["week"]) if pid == dee] == [0]
+    # a session whose patient does not exist is left out, not an error
+    backend.add_session(999999, "", {"strength": [{"muscle_group": "quads", "grade": 4}]}, 3)
+    assert backend.get_weekly_summary() == moved
+
+    # notes search
+    hits = backend.search_notes("pus")
+    assert [(h["source"], h["patient_id"]) for h in hits] == [("patient", ann)]
+    assert {h["source_id"] for h in backend.search_notes("knee")} >= {s1}
+    assert backend.search_notes("pus", patient_id=bob) == []
+    assert backend.search_notes("   ") == []
+
+
+# ---------- Benchmark ----------
+def _timed(label: str, fn: Callable, results: Dict[str, float]):
+    start = time.perf_counter()
+    out = fn()
+    results[label] = time.perf_counter() - start
+    return out
+
+
+def run_benchmark(backend: StorageBackend, patients: int = 2000, sessions_per_patient: int = 5) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    ids: List[int] = _timed(f"add_patient x{patients}", lambda: [
+        backend.add_patient({"name": f"patient {i}", "age": 20 + i % 60, "surgical_procedure": "TKR" if i % 2 else "ACL"})
+        for i in range(patients)
+    ], results)
+    sample = ids[:: max(1, len(ids) // 200)]
+    _timed(f"add_session x{len(sample) * sessions_per_patient}", lambda: [
+        backend.add_session(pid, f"session {n} knee flexion", {"strength": [{"muscle_group": "quads", "grade": n % 6}]}, n % 11)
+        for pid in sample for n in range(sessions_per_patient)
+    ], results)
+    _timed(f"get_patient x{len(sample)}", lambda: [backend.get_patient(pid) for pid in sample], results)
+    _timed(f"get_sessions_for_patient x{len(sample)}", lambda: [backend.get_sessions_for_patient(pid) for pid in sample], results)
+    _timed(f"get_session_series x{len(sample)}", lambda: [backend.get_session_series(pid) for pid in sample], results)
+    _timed(f"get_patient_timeline x{len(sample)}", lambda: [backend.get_patient_timeline(pid) for pid in sample], results)
+    _timed("get_all_patients", backend.get_all_patients, results)
+    _timed("get_patient_ids_seen", lambda: backend.get_patient_ids_seen(since="2000-01-01"), results)
+    _timed("get_weekly_summary", backend.get_weekly_summary, results)
+    _timed("list_patients page (50, by name)", lambda: backend.list_patients(order_by="name", limit=50), results)
+    _timed("count_patients (filtered)", lambda: backend.count_patients({"surgical_procedure": "tkr"}), results)
+    _timed("search_notes", lambda: backend.search_notes("knee"), results)
+    return results
+
+
+if __name__ == "__main__":
+    kinds = [sys.argv[1]] if len(sys.argv) > 1 else list(BACKENDS)
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for kind in kinds:
+        check_conformance(fresh_backend(kind))
+        print(f"[{kind}] conformance OK")
+
+    for kind in kinds:
+        results = run_benchmark(fresh_backend(kind), patients=size)
+        print(f"\n[{kind}] benchmark ({size} patients)")
+        for label, seconds in results.items():
+            print(f"  {label:<40} {seconds * 1000:10.1f} ms")
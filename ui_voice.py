@@ -1,9 +1,10 @@
 import streamlit as st
 import json
-# Keep your existing imports
-from voice_module import transcribe_uploaded_file, transcribe_microphone
+# Keep your existing imports (voice_module is imported in voice_note_ui:
+# speech_recognition and pydub are only needed once this page is opened)
 from voice_parser import extract_rom_data
-from datamod_sql import get_all_patients, get_patient, add_session, update_patient_fields
+from storage_backend import get_backend
+from patient_directory import get_directory
 
 # Keep your normalize_parsed function exactly as it is
 def normalize_parsed(parsed_list):
@@ -33,11 +34,42 @@ def normalize_parsed(parsed_list):
             result["mobility_status"].append(item.get("status"))
     return result
 
+def suggested_updates(parsed):
+    """
+    Split parsed voice data into (simple patient field updates, new ROM
+    readings, new strength readings). Pure function, no DB access.
+    """
+    updates = {}
+    if parsed.get("swelling") is not None:
+        updates["swelling"] = "Yes" if parsed["swelling"] else "No"
+    if parsed.get("pain_level") is not None:
+        updates["pain_level"] = parsed["pain_level"]
+    if parsed.get("infection_signs"):
+        updates["infection_signs"] = json.dumps(parsed["infection_signs"])
+    if parsed.get("mobility_status"):
+        updates["mobility_status"] = json.dumps(parsed["mobility_status"])
+
+    new_rom = []
+    for r in parsed.get("rom") or []:
+        joint = r.get("rom_type") or r.get("joint")
+        if joint:
+            new_rom.append({"joint": joint, "start": r.get("start"), "end": r.get("end")})
+
+    new_strength = []
+    for s in parsed.get("strength") or []:
+        mg = s.get("muscle_group") or s.get("muscle")
+        grade = s.get("grade")
+        if mg is not None and grade is not None:
+            new_strength.append({"muscle_group": mg, "grade": grade})
+
+    return updates, new_rom, new_strength
+
 # ----------------------------
 # MAIN UI FUNCTION (FIXED)
 # ----------------------------
 def voice_note_ui():
     st.header("Voice Notes — Transcribe & Auto-Fill")
+    from voice_module import transcribe_uploaded_file, transcribe_microphone
 
     # 1. INITIALIZE SESSION STATE
     # We need to remember these values across reruns (between Record and Apply)
@@ -46,14 +78,13 @@ def voice_note_ui():
     if "v_parsed" not in st.session_state:
         st.session_state["v_parsed"] = {}
 
-    patients = get_all_patients()
-    if not patients:
+    backend = get_backend()
+    directory = get_directory()
+    if not len(directory):
         st.warning("No patients found. Add a patient first in Patient Records.")
         return
 
-    options = [f"{p['id']} — {p['name']}" for p in patients]
-    selected = st.selectbox("Select patient to update", options)
-    pid = int(selected.split(" — ")[0])
+    pid = st.selectbox("Select patient to update", directory.ids_by_name(), format_func=directory.label)
 
     st.write("Upload audio, record, or paste transcript:")
     uploaded = st.file_uploader("Upload audio (wav/mp3)", type=["wav", "mp3", "m4a"])
@@ -123,79 +154,37 @@ def voice_note_ui():
     st.json(parsed)
 
     # ----------------------------
-    # BUILD UPDATES DICT
+    # SUGGESTED UPDATES (preview)
     # ----------------------------
-    # Rerun the logic to build 'updates' based on the persistent 'parsed' data
-    patient = get_patient(pid)
-    updates = {}
-
-    # ROM Logic
-    rom_entries_existing = []
-    if patient.get("rom_entries"):
-        try:
-            rom_entries_existing = json.loads(patient["rom_entries"])
-        except:
-            rom_entries_existing = []
-
-    if "rom" in parsed:
-        for r in parsed["rom"]:
-            joint = r.get("rom_type") or r.get("joint")
-            if joint:
-                rom_entries_existing.append({
-                    "joint": joint,
-                    "start": r.get("start"),
-                    "end": r.get("end")
-                })
-        if parsed["rom"]: # Only update if new ROM data exists
-            updates["rom_entries"] = json.dumps(rom_entries_existing)
-
-    # Strength Logic
-    strength_entries_existing = []
-    if patient.get("strength_entries"):
-        try:
-            strength_entries_existing = json.loads(patient["strength_entries"])
-        except:
-            strength_entries_existing = []
-
-    if "strength" in parsed:
-        for s in parsed["strength"]:
-            mg = s.get("muscle_group") or s.get("muscle")
-            grade = s.get("grade")
-            if mg is not None and grade is not None:
-                strength_entries_existing.append({
-                    "muscle_group": mg,
-                    "grade": grade
-                })
-        if parsed["strength"]:
-            updates["strength_entries"] = json.dumps(strength_entries_existing)
-
-    # Simple Fields
-    if parsed.get("swelling") is not None:
-        updates["swelling"] = "Yes" if parsed["swelling"] else "No"
-
-    if parsed.get("pain_level") is not None:
-        updates["pain_level"] = parsed["pain_level"]
-
-    if parsed.get("infection_signs"):
-        updates["infection_signs"] = json.dumps(parsed["infection_signs"])
-
-    if parsed.get("mobility_status"):
-        updates["mobility_status"] = json.dumps(parsed["mobility_status"])
+    # Built from the parsed transcript alone: the patient's stored ROM/strength
+    # history is never read or rewritten. New readings are appended as rows
+    # when the session is saved.
+    updates, new_rom, new_strength = suggested_updates(parsed)
 
     st.markdown("**Suggested updates:**")
-    st.write(updates)
+    preview = dict(updates)
+    if new_rom:
+        preview["new ROM readings"] = new_rom
+    if new_strength:
+        preview["new strength readings"] = new_strength
+    st.write(preview)
 
     # ----------------------------
     # APPLY BUTTON
     # ----------------------------
     if st.button("Apply suggested updates to patient"):
-        if updates:
+        if preview:
             # We use the transcript from session_state for the session log
             transcript_to_save = st.session_state["v_transcript"]
-            
-            ok = update_patient_fields(pid, updates)
-            add_session(pid, transcript_to_save, parsed, parsed.get("pain_level"))
-            
+
+            # One atomic write: field updates + session + measurement rows
+            try:
+                backend.apply_session_updates(pid, transcript_to_save, parsed, updates, parsed.get("pain_level"))
+                ok = True
+            except LookupError:
+                ok = False
+            directory.upsert(pid)
+
             if ok:
                 st.success("Patient record updated and session saved.")
                 # Optional: Clear state after successful save
@@ -0,0 +1,249 @@
+# writer_service.py
+"""
+Single-writer commit queue for the SQLite store.
+
+One background thread owns the write connection. Callers submit write
+functions and get a Future back; the thread drains everything queued (up to
+max_batch items, optionally lingering max_delay seconds for more) and commits
+it as one transaction. Writes that arrive while a commit is in flight form
+the next batch, so N concurrent saves cost one fsync instead of N and never
+fight each other for the write lock.
+
+Each item runs inside its own SAVEPOINT: a failing item is rolled back and
+gets the exception on its Future without affecting the rest of the batch.
+If the database is locked by another process the whole batch is retried
+with exponential backoff. An item that raises KeyboardInterrupt or
+SystemExit stops the writer: the items before it are committed, and every
+Future still waiting fails with RuntimeError instead of hanging.
+
+    sid = get_writer().submit(datamod_sql.add_session, pid, text, parsed, pain).result()
+
+Opt-in (SQLiteBackend(write_queue=True) or PYSIO_WRITE_QUEUE=1): the win
+is the fsyncs saved, so it depends on what a commit costs. `python
+writer_service.py` runs 8 threads of add_session both ways. With
+synchronous=FULL, where every commit fsyncs, the queue measured x2.0-2.6.
+With the app's synchronous=NORMAL a WAL commit does not fsync, and the
+result was anywhere from x0.8 to x2 between runs. That is not worth a
+thread hop on every save, so direct commits stay the default. Turn the
+queue on for synchronous=FULL, slow disks, or many writers contending for
+the lock (the batch also retries "locked" itself).
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+import datamod_sql
+
+_STOP = object()
+
+
+def _is_busy(exc: BaseException) -> bool:
+    msg = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+class WriterService:
+    def __init__(self, max_batch: int = 64, max_delay: float = 0.0,
+                 retries: int = 6, backoff: float = 0.01):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.batches = 0
+        self.writes = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()   # a submit never lands after the queue is failed
+        self._thread = threading.Thread(target=self._run, name="pysio-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) to run on the writer connection; returns its Future."""
+        fut: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WriterService is closed")
+            self._queue.put((fut, fn, args, kwargs))
+        return fut
+
+    def close(self, wait: bool = True) -> None:
+        """Commit whatever is queued, then stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        if wait:
+            self._thread.join()
+
+    # ---------- writer thread ----------
+    def _run(self) -> None:
+        batch: List[tuple] = []
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._commit(batch)
+        except BaseException as exc:
+            # nothing queued can run any more: fail it rather than leave callers waiting
+            self._fail_pending(batch, exc)
+            raise
+        finally:
+            datamod_sql.close_conn()
+
+    def _fail_pending(self, batch: List[tuple], exc: BaseException) -> None:
+        with self._lock:
+            self._closed = True
+        pending = [fut for fut, *_ in batch]
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                pending.append(item[0])
+        for fut in pending:
+            if not fut.done():
+                error = RuntimeError(f"WriterService stopped: {exc!r}")
+                error.__cause__ = exc
+                fut.set_exception(error)
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, batch: List[tuple]) -> None:
+        attempt = 0
+        while True:
+            conn = datamod_sql.get_conn()
+            outcomes: List[Tuple[bool, Any]] = []
+            fatal: Optional[BaseException] = None
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for _, fn, args, kwargs in batch:
+                    conn.execute("SAVEPOINT queued_write")
+                    try:
+                        outcomes.append((True, fn(*args, **kwargs)))
+                    except BaseException as exc:
+                        conn.execute("ROLLBACK TO queued_write")
+                        outcomes.append((False, exc))
+                        if not isinstance(exc, Exception):
+                            fatal = exc  # KeyboardInterrupt, SystemExit: stop after this item
+                    conn.execute("RELEASE queued_write")
+                    if fatal is not None:
+                        break
+                conn.commit()
+            except sqlite3.Error as exc:
+                if conn.in_transaction:
+                    conn.rollback()
+                if _is_busy(exc) and attempt < self.retries:
+                    time.sleep(self.backoff * (2 ** attempt))
+                    attempt += 1
+                    continue
+                for fut, *_ in batch:
+                    fut.set_exception(exc)
+                return
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise  # _run fails the batch and the queue
+
+            self.batches += 1
+            self.writes += len(outcomes)
+            for (fut, *_), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+            if fatal is not None:
+                raise fatal  # the items after it are failed by _run
+            return
+
+
+_writer: Optional[WriterService] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriterService:
+    """The process-wide writer, started on first use (and again if it stopped on an error)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer._thread.is_alive():
+            _writer = WriterService()
+            atexit.register(_writer.close)
+        return _writer
+
+
+# -----------------------------
+# Test locally
+# -----------------------------
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    THREADS = 8
+    WRITES = 200
+
+    def hammer(write: Callable[[int], Any]) -> float:
+        errors: List[BaseException] = []
+
+        def worker(n):
+            try:
+                for i in range(WRITES):
+                    write(n * WRITES + i)
+            except BaseException as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            print(f"  {len(errors)} thread(s) failed, first error: {errors[0]!r}")
+        return elapsed
+
+    # Group commit saves fsyncs, so its win depends on what a commit costs:
+    # with synchronous=NORMAL (the app's setting) a WAL commit does not fsync
+    # and batching gains little; with synchronous=FULL every commit fsyncs.
+    base_pragmas = datamod_sql.PRAGMAS
+    for sync in ("NORMAL", "FULL"):
+        datamod_sql.PRAGMAS = tuple(p for p in base_pragmas if "synchronous" not in p) + (f"PRAGMA synchronous={sync}",)
+        datamod_sql.DB_FILE = os.path.join(tempfile.mkdtemp(), "writer_check.db")  # fresh connections
+        datamod_sql.init_db()
+        pid = datamod_sql.add_patient_from_record({"name": "Writer Check"})
+        total = THREADS * WRITES
+        print(f"synchronous={sync}:")
+
+        direct = hammer(lambda i: datamod_sql.add_session(pid, f"direct {i}", {}, i % 11))
+        print(f"  {total} add_session calls from {THREADS} threads, each committing: {direct:.2f}s "
+              f"({total / direct:.0f} writes/s)")
+
+        for batch_size in (1, 8, 64):
+            writer = WriterService(max_batch=batch_size)
+            queued = hammer(lambda i: writer.submit(datamod_sql.add_session, pid, f"queued {i}", {}, i % 11).result())
+            writer.close()
+            print(f"  same load through WriterService(max_batch={batch_size}): {queued:.2f}s "
+                  f"({total / queued:.0f} writes/s, x{direct / queued:.2f}, "
+                  f"{writer.writes / max(writer.batches, 1):.1f} writes/commit)")
+    datamod_sql.PRAGMAS = base_pragmas